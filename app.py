@@ -1,13 +1,33 @@
+from dotenv import load_dotenv
+
+# Load environment variables once, before the modules below read them; metrics picks its mode on import
+load_dotenv()
+
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
-from flask_socketio import SocketIO, emit
-from iot_chatbot import IoTChatbot
+from flask_socketio import SocketIO, emit, join_room
+from task_pool import WorkerPool, QueueFull
+from context_cache import ConversationContextCache
+from persistence import WriteBehindQueue
+from sidebar_cache import SidebarCache
+from response_cache import MemoryCacheBackend
+from rate_limit import create_rate_limiter
+from message_queue import socketio_queue_options
+from hedging import StopEvent
+from metrics import (
+    timed, render_latest, EMIT_SECONDS, QUEUE_WAIT_SECONDS, MESSAGE_SECONDS,
+    LLM_QUEUED, LLM_ACTIVE, MESSAGES, ERRORS
+)
 import os
-from dotenv import load_dotenv
+import sys
+import math
+import signal
 import socket
+import threading
+import time
 import logging
 from database import (
-    db, Database, User, ChatHistory, ChatMessage,
-    get_conversation_history
+    db, Database, User, ChatHistory, ChatMessage, REPLICA_BIND,
+    get_conversation_history, get_chat_messages
 )
 from datetime import timedelta, datetime
 from flask_login import login_required, current_user, LoginManager, login_user, logout_user
@@ -15,34 +35,165 @@ from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO))
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', os.urandom(24))
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
-
-# Initialize database
+socketio = SocketIO()
 database = Database()
-database.init_app(app)
-
-# Initialize login manager
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+
+def create_app():
+    """Build the Flask app and bind the extensions to it.
+
+    Nothing here talks to the database or the LLM provider, so a new worker
+    process can take its first request quickly: the tables are checked on the
+    first request or Socket.IO connection, and the chatbot is built with the
+    first message (see get_chatbot), unless PREWARM does both in the background.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', os.urandom(24))
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+    # Under gevent/eventlet (serve.py), pure-Python PyMySQL lets other greenlets run while a query waits
+    mysql_driver = 'mysql+pymysql' if os.getenv('SOCKETIO_ASYNC_MODE') in ('gevent', 'eventlet') else 'mysql'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or f"{mysql_driver}://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
+    # Optional read replica for chat history reads, see database.read_session
+    if os.getenv('DATABASE_REPLICA_URL'):
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: os.getenv('DATABASE_REPLICA_URL')}
+    # Seconds after a write during which that chat's and user's history is read from the primary
+    app.config['REPLICA_LAG_WINDOW'] = float(os.getenv('REPLICA_LAG_WINDOW', 5))
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Stream answers to the browser chunk by chunk instead of waiting for the full completion
+    app.config['STREAM_RESPONSES'] = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+    # Keep the partial answer of a generation the user stopped instead of discarding it
+    app.config['PERSIST_PARTIAL_ON_STOP'] = os.getenv('PERSIST_PARTIAL_ON_STOP', 'false').lower() == 'true'
+    # Messages per page when loading a chat, newest first
+    app.config['CHAT_PAGE_SIZE'] = int(os.getenv('CHAT_PAGE_SIZE', 50))
+    app.config['CHAT_PAGE_SIZE_MAX'] = int(os.getenv('CHAT_PAGE_SIZE_MAX', 200))
+    # Build the chatbot, check the tables and connect upstream in the background right after startup
+    app.config['PREWARM'] = os.getenv('PREWARM', 'false').lower() == 'true'
+
+    # Per-packet Socket.IO/Engine.IO logging is costly, only turn it on to debug the transport
+    socketio_debug = os.getenv('SOCKETIO_DEBUG_LOGS', 'false').lower() == 'true'
+    # With SOCKETIO_MESSAGE_QUEUE set, several server processes share clients, rooms and emits through the queue.
+    # Threads unless serve.py asked for gevent/eventlet: auto-detection would pick gevent whenever it is
+    # installed, even though only serve.py monkey-patches for it
+    socketio.init_app(app, cors_allowed_origins="*", logger=socketio_debug, engineio_logger=socketio_debug,
+                      async_mode=os.getenv('SOCKETIO_ASYNC_MODE') or 'threading', **socketio_queue_options())
+
+    database.init_app(app, create_tables=False)
+
+    login_manager.init_app(app)
+    login_manager.login_view = 'login'
+    return app
+
+app = create_app()
+
+# Loaded users, re-attached to each request's session without a query
+user_cache = MemoryCacheBackend(max_entries=int(os.getenv('USER_CACHE_SIZE', 1000)))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    user = user_cache.get(user_id)
+    if user is not None:
+        return db.session.merge(user, load=False)
+    user = User.query.get(user_id)
+    if user is None:
+        return None
+    # Cache the instance detached so a commit in this request cannot expire it, and use an attached copy
+    db.session.expunge(user)
+    user_cache.set(user_id, user, USER_CACHE_TTL)
+    return db.session.merge(user, load=False)
+
+# Built by the first message that needs it, see get_chatbot
+_chatbot = None
+_chatbot_lock = threading.Lock()
+
+def get_chatbot():
+    """The process's IoTChatbot, built on first use"""
+    global _chatbot
+    if _chatbot is None:
+        with _chatbot_lock:
+            if _chatbot is None:
+                # Imported here so the classifier, prompts and numpy load with the first message, not at startup
+                from iot_chatbot import IoTChatbot
+                _chatbot = IoTChatbot()
+    return _chatbot
+
+@app.before_request
+def create_tables():
+    database.create_tables(app)
+
+def prewarm():
+    """Do the work of the first requests ahead of them: tables, templates, chatbot and an upstream connection"""
+    started = time.perf_counter()
+    try:
+        database.create_tables(app)
+        app.jinja_env.get_template('index.html')
+        get_chatbot().upstream.warm_up()
+        logger.info(f"Prewarmed in {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        logger.error(f"Error prewarming: {str(e)}")
+
+# Upstream LLM calls run on a bounded pool instead of inside the Socket.IO handlers,
+# taking turns between users so one of them cannot crowd out the others
+llm_pool = WorkerPool(
+    max_workers=int(os.getenv('LLM_MAX_WORKERS', 8)),
+    queue_depth=int(os.getenv('LLM_QUEUE_DEPTH', 32)),
+    spawn=socketio.start_background_task,
+    fair=os.getenv('LLM_FAIR_SCHEDULING', 'true').lower() == 'true',
+    max_queued_per_key=int(os.getenv('LLM_QUEUE_PER_CLIENT', 4)),
+    # Shed messages that would wait longer than this instead of letting every answer slow down
+    max_wait=float(os.getenv('LLM_MAX_QUEUE_WAIT')) if os.getenv('LLM_MAX_QUEUE_WAIT') else None
+)
+# Seconds between queue_position updates to clients waiting for a worker
+QUEUE_POSITION_INTERVAL = float(os.getenv('QUEUE_POSITION_INTERVAL', 1))
+# Share of the worker turns of logged-in users against anonymous sessions
+LLM_USER_WEIGHT = int(os.getenv('LLM_USER_WEIGHT', 3))
+LLM_ANON_WEIGHT = int(os.getenv('LLM_ANON_WEIGHT', 1))
+
+# Messages per minute per user or session, shared by worker processes through its backend
+rate_limiter = create_rate_limiter()
+
+# Chat messages are written in batches after the answer has been sent
+message_writer = WriteBehindQueue(
+    app,
+    flush_interval=float(os.getenv('PERSIST_FLUSH_INTERVAL', 0.2)),
+    batch_size=int(os.getenv('PERSIST_BATCH_SIZE', 200)),
+    spawn=socketio.start_background_task,
+    max_attempts=int(os.getenv('PERSIST_MAX_ATTEMPTS', 8)),
+    max_pending=int(os.getenv('PERSIST_MAX_PENDING', 10000))
+)
+database.writer = message_writer
+message_writer.start()
+
+def load_recent_turns(chat_id, limit):
+    """Load the newest turns of a chat, oldest first, to warm the context cache"""
+    message_writer.flush_pending(chat_id=chat_id)
+    messages, _ = get_chat_messages(chat_id, limit)
+    return [(msg.user_message, msg.bot_response) for msg in messages]
+
+# Recent turns of active chats, sent with each new message as conversation context
+context_cache = ConversationContextCache(
+    load_recent_turns,
+    max_chats=int(os.getenv('CONTEXT_CACHE_CHATS', 1000)),
+    max_turns=int(os.getenv('CONTEXT_MAX_TURNS', 20)),
+    token_budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', 2000)),
+    ttl=int(os.getenv('CONTEXT_CACHE_TTL', 900))
+)
 
-chatbot = IoTChatbot()
+def load_sidebar(user_id):
+    """Build a user's chat sidebar from the database, including messages still queued; None if it failed"""
+    message_writer.flush_pending(user_id=user_id)
+    return get_conversation_history(user_id)
+
+# Chat sidebar per user, updated in place as messages are saved
+sidebar_cache = SidebarCache(
+    load_sidebar,
+    max_users=int(os.getenv('SIDEBAR_CACHE_USERS', 1000)),
+    ttl=int(os.getenv('SIDEBAR_CACHE_TTL', 300))
+)
 
 @app.route('/')
 def index():
@@ -51,7 +202,7 @@ def index():
     username = session.get('username')
     
     if user_id:
-        chat_history = get_conversation_history(user_id)
+        chat_history = sidebar_cache.get(user_id)
         return render_template('index.html', 
                              user=user_id, 
                              email=email, 
@@ -132,54 +283,267 @@ def logout():
 @socketio.on('connect')
 def handle_connect():
     logger.info('Client connected')
+    # Socket.IO events skip before_request, and every client connects before sending any
+    database.create_tables(app)
+    # One room per user, reachable from any server process, e.g. to end every session of a deleted account
+    if session.get('user'):
+        join_room(f"user:{session['user']}")
 
 @socketio.on('disconnect')
 def handle_disconnect():
     logger.info('Client disconnected')
+    # Nobody is left to read the answer, stop generating it
+    stop_generation(request.sid)
+    with active_generations_lock:
+        truncated_answers.pop(request.sid, None)
+
+class Generation:
+    """An answer being generated for one client"""
+
+    def __init__(self):
+        self.job = None
+        # Setting it also closes an upstream stream the worker is still waiting on
+        self.stop_event = StopEvent()
+        self.received_at = time.perf_counter()
+        # Queue position last sent to the client
+        self.position = None
+
+class TruncatedAnswer:
+    """An answer cut off by max_tokens, kept so the client can ask for the rest"""
+
+    def __init__(self, chat_id, message, history, answer):
+        self.chat_id = chat_id
+        self.message = message
+        self.history = history
+        self.answer = answer
+
+# In-flight generations keyed by Socket.IO session id
+active_generations = {}
+# The last answer of each session if it was cut off, both guarded by the same lock
+truncated_answers = {}
+active_generations_lock = threading.Lock()
+
+# Saved as the user message of a turn that continues a cut-off answer
+CONTINUE_MESSAGE = 'Continue'
+
+def stop_generation(sid):
+    """Stop the generation running for sid; returns True if there was one"""
+    with active_generations_lock:
+        generation = active_generations.pop(sid, None)
+    if not generation:
+        return False
+    generation.stop_event.set()
+    # A job that has not started yet just leaves the queue
+    if generation.job is not None and llm_pool.cancel(generation.job):
+        LLM_QUEUED.dec()
+        MESSAGES.labels(outcome='cancelled').inc()
+    return True
 
 @socketio.on('send_message')
 def handle_message(data):
+    user_id = session.get('user')
+    sid = request.sid
+    # The client waits for one answer at a time, a new message replaces the old one
+    stop_generation(sid)
+    # Logged-in users are limited and scheduled per account, everyone else per Socket.IO session
+    client_key = f'user:{user_id}' if user_id else f'sid:{sid}'
+    if rate_limiter is not None:
+        retry_after = rate_limiter.check(client_key, logged_in=bool(user_id))
+        if retry_after:
+            MESSAGES.labels(outcome='rate_limited').inc()
+            emit('receive_message', {
+                'message': f'You are sending messages too quickly. Please wait {math.ceil(retry_after)} seconds and try again.',
+                'retry_after': retry_after
+            })
+            return
+    generation = Generation()
+    with active_generations_lock:
+        active_generations[sid] = generation
     try:
-        user_id = session.get('user')
-        message = data.get('message')
-        chat_id = data.get('chat_id')
-        is_new_chat = data.get('is_new_chat', False)
-        
-        # Get response from chatbot
-        response = chatbot.get_response(message)
-        
-        if user_id:
-            # Save chat history only for logged-in users
-            if is_new_chat:
-                chat = ChatHistory(user_id=user_id)
-                db.session.add(chat)
-                db.session.commit()
-                chat_id = chat.id
-            elif not chat_id:
-                chat = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.created_at.desc()).first()
-                if not chat:
+        # Generate on the worker pool so the event handler returns immediately
+        LLM_QUEUED.inc()
+        weight = LLM_USER_WEIGHT if user_id else LLM_ANON_WEIGHT
+        generation.job = llm_pool.submit_for(client_key, weight, process_message, sid, user_id, data, generation)
+    except QueueFull as e:
+        LLM_QUEUED.dec()
+        MESSAGES.labels(outcome='rejected').inc()
+        with active_generations_lock:
+            active_generations.pop(sid, None)
+        logger.warning(f"LLM queue full, rejecting message from {sid}: {str(e)}")
+        retry_after = max(math.ceil(e.retry_after or 1), 1)
+        emit('server_busy', {
+            'message': f'The assistant is busy right now. Please try again in {retry_after} seconds.',
+            'retry_after': retry_after
+        })
+        return
+    report_queue_position(sid, generation)
+
+def report_queue_position(sid, generation, positions=None):
+    """Tell a client waiting for a worker where it is in the queue, when that has changed"""
+    if positions is None:
+        positions = llm_pool.waiting_positions()
+    position = positions.get(generation.job)
+    if position is None or position == generation.position:
+        return
+    generation.position = position
+    with timed(EMIT_SECONDS.labels(event='queue_position')):
+        socketio.emit('queue_position', {
+            'position': position,
+            'estimated_wait': math.ceil(llm_pool.estimated_wait(position))
+        }, to=sid)
+
+def report_queue_positions():
+    """Background loop that keeps waiting clients up to date as the queue moves"""
+    while True:
+        socketio.sleep(QUEUE_POSITION_INTERVAL)
+        try:
+            positions = llm_pool.waiting_positions()
+            if not positions:
+                continue
+            with active_generations_lock:
+                waiting = list(active_generations.items())
+            for sid, generation in waiting:
+                report_queue_position(sid, generation, positions)
+        except Exception as e:
+            logger.error(f"Error reporting queue positions: {str(e)}")
+
+socketio.start_background_task(report_queue_positions)
+if app.config['PREWARM']:
+    socketio.start_background_task(prewarm)
+
+@socketio.on('stop_message')
+def handle_stop_message():
+    stop_generation(request.sid)
+    emit('message_stopped')
+
+def process_message(sid, user_id, data, generation):
+    """Generate and save the answer to one message, emitting the result back to sid"""
+    LLM_QUEUED.dec()
+    LLM_ACTIVE.inc()
+    QUEUE_WAIT_SECONDS.observe(time.perf_counter() - generation.received_at)
+    with app.app_context():
+        try:
+            message = data.get('message')
+            chat_id = data.get('chat_id')
+            is_new_chat = data.get('is_new_chat', False)
+            history = None
+            chat = None
+            continuation = None
+            
+            # Carry on with the last answer of this session that max_tokens cut off
+            if data.get('continue'):
+                with active_generations_lock:
+                    continuation = truncated_answers.pop(sid, None)
+                if continuation is None:
+                    socketio.emit('receive_message', {'message': 'There is no cut-off answer to continue.'}, to=sid)
+                    return
+                message = continuation.message
+                chat_id = continuation.chat_id
+                is_new_chat = False
+            
+            if user_id:
+                # Only continue a chat that belongs to this user
+                if chat_id and not is_new_chat:
+                    chat = ChatHistory.query.filter_by(id=chat_id, user_id=user_id).first()
+                    chat_id = chat.id if chat else None
+                
+                # Resolve the chat up front so streamed chunks can carry its id
+                if is_new_chat:
                     chat = ChatHistory(user_id=user_id)
                     db.session.add(chat)
                     db.session.commit()
-                chat_id = chat.id
+                    chat_id = chat.id
+                elif not chat_id:
+                    chat = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.created_at.desc()).first()
+                    if not chat:
+                        chat = ChatHistory(user_id=user_id)
+                        db.session.add(chat)
+                        db.session.commit()
+                    chat_id = chat.id
+                
+                # Earlier turns of an existing chat, trimmed to the context token budget
+                if not is_new_chat and continuation is None:
+                    history = context_cache.get_history(chat_id)
             
-            # Save message to database
-            chat_message = ChatMessage(
-                chat_id=chat_id,
-                user_message=message,
-                bot_response=response
-            )
-            db.session.add(chat_message)
-            db.session.commit()
-        
-        emit('receive_message', {
-            'message': response,
-            'chat_id': chat_id
-        })
-        
-    except Exception as e:
-        print(f"Error handling message: {str(e)}")
-        emit('receive_message', {'message': 'Error processing message'})
+            # A continuation is asked with the same context as the answer it continues
+            answer_so_far = ''
+            if continuation is not None:
+                history = continuation.history
+                answer_so_far = continuation.answer
+            
+            # Get response from chatbot, streaming upstream either way so a stop can abort it
+            chunks = []
+            result = {}
+            for chunk in get_chatbot().stream_response(message, stop_event=generation.stop_event, history=history,
+                                                 continue_from=answer_so_far, result=result):
+                chunks.append(chunk)
+                if app.config['STREAM_RESPONSES']:
+                    with timed(EMIT_SECONDS.labels(event='receive_chunk')):
+                        socketio.emit('receive_chunk', {
+                            'chunk': chunk,
+                            'chat_id': chat_id
+                        }, to=sid)
+            response = ''.join(chunks)
+            stopped = generation.stop_event.is_set()
+            truncated = result.get('truncated', False) and not stopped
+            
+            # Remember a cut-off answer so the client can offer to continue it
+            with active_generations_lock:
+                if truncated:
+                    truncated_answers[sid] = TruncatedAnswer(chat_id, message, history, answer_so_far + response)
+                else:
+                    truncated_answers.pop(sid, None)
+            
+            # The stop handler has already told the client
+            if not stopped:
+                with timed(EMIT_SECONDS.labels(event='receive_message')):
+                    socketio.emit('receive_message', {
+                        'message': response,
+                        'chat_id': chat_id,
+                        'truncated': truncated
+                    }, to=sid)
+            MESSAGES.labels(outcome='stopped' if stopped else 'answered').inc()
+            
+            # A stopped answer is only kept when configured, and only if something was generated
+            if user_id and (not stopped or (app.config['PERSIST_PARTIAL_ON_STOP'] and response.strip())):
+                # Save the assembled answer once, only for logged-in users, after it was sent
+                user_message = CONTINUE_MESSAGE if continuation is not None else message
+                message_writer.enqueue(chat_id, user_message, response, user_id=user_id)
+                context_cache.record_turn(chat_id, user_message, response)
+                sidebar_cache.record_message(user_id, chat_id, chat.created_at, user_message, response)
+            
+        except Exception as e:
+            db.session.rollback()
+            ERRORS.labels(stage='process_message').inc()
+            MESSAGES.labels(outcome='error').inc()
+            print(f"Error handling message: {str(e)}")
+            socketio.emit('receive_message', {'message': 'Error processing message'}, to=sid)
+        finally:
+            db.session.remove()
+            with active_generations_lock:
+                if active_generations.get(sid) is generation:
+                    del active_generations[sid]
+            LLM_ACTIVE.dec()
+            MESSAGE_SECONDS.observe(time.perf_counter() - generation.received_at)
+
+def page_size(requested):
+    """Clamp a client-requested page size to the configured bounds"""
+    try:
+        size = int(requested or app.config['CHAT_PAGE_SIZE'])
+    except (TypeError, ValueError):
+        size = app.config['CHAT_PAGE_SIZE']
+    return max(1, min(size, app.config['CHAT_PAGE_SIZE_MAX']))
+
+def serialize_messages(messages, next_cursor):
+    return {
+        'messages': [{
+            'user_message': msg.user_message,
+            'bot_response': msg.bot_response,
+            'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        } for msg in messages],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
 
 @socketio.on('load_chat')
 def handle_load_chat(data):
@@ -193,13 +557,12 @@ def handle_load_chat(data):
         # Get specific chat from database
         chat = ChatHistory.query.filter_by(id=chat_id, user_id=user_id).first()
         if chat:
-            messages = ChatMessage.query.filter_by(chat_id=chat_id).order_by(ChatMessage.created_at.asc()).all()
+            message_writer.flush_pending(chat_id=chat.id)
+            # Most recent page first, the client follows next_cursor for older messages
+            messages, next_cursor = get_chat_messages(chat_id, page_size(data.get('limit')), data.get('before'))
             emit('chat_loaded', {
-                'messages': [{
-                    'user_message': msg.user_message,
-                    'bot_response': msg.bot_response,
-                    'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
-                } for msg in messages]
+                'chat_id': chat.id,
+                **serialize_messages(messages, next_cursor)
             })
     except Exception as e:
         logger.error(f"Error loading chat: {str(e)}")
@@ -219,21 +582,27 @@ def get_chat_history():
         chat = ChatHistory.query.filter_by(id=chat_id, user_id=user_id).first()
         if not chat:
             return jsonify({'error': 'Chat not found'}), 404
-            
-        messages = ChatMessage.query.filter_by(chat_id=chat_id).order_by(ChatMessage.created_at.asc()).all()
         
-        return jsonify({
-            'messages': [{
-                'user_message': msg.user_message,
-                'bot_response': msg.bot_response,
-                'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            } for msg in messages]
-        })
+        message_writer.flush_pending(chat_id=chat.id)
+        try:
+            messages, next_cursor = get_chat_messages(
+                chat_id, page_size(request.args.get('limit')), request.args.get('before')
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        return jsonify(serialize_messages(messages, next_cursor))
         
     except Exception as e:
         print(f"Error getting chat history: {str(e)}")
         return jsonify({'error': 'Error getting chat history'}), 500
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics, summed over all worker processes when PROMETHEUS_MULTIPROC_DIR is set"""
+    body, content_type = render_latest()
+    return body, 200, {'Content-Type': content_type}
+
 @app.route('/new_chat', methods=['POST'])
 @login_required
 def new_chat():
@@ -253,7 +622,8 @@ def handle_new_chat():
     try:
         user_id = session.get('user')
         if user_id:
-            # Create new chat history
+            # Create new chat history; the sidebar cache picks it up with its first message,
+            # since chats without messages are not listed
             chat = ChatHistory(user_id=user_id)
             db.session.add(chat)
             db.session.commit()
@@ -310,6 +680,7 @@ def update_profile():
         if user:
             user.username = new_username
             db.session.commit()
+            user_cache.delete(user_id)
             session['username'] = new_username
             return jsonify({'message': 'Profile updated successfully'})
         
@@ -346,6 +717,7 @@ def reset_password():
 
         user.set_password(new_password)
         db.session.commit()
+        user_cache.delete(user_id)
         return jsonify({'message': 'Password updated successfully'})
     except Exception as e:
         logger.error(f"Error resetting password: {str(e)}")
@@ -371,7 +743,10 @@ def delete_account():
         if not user.check_password(password):
             return jsonify({'error': 'Incorrect password'}), 400
 
-        # Delete user's chat history and messages
+        user_cache.delete(user_id)
+        sidebar_cache.invalidate(user_id)
+        # Delete user's chat history and messages, including any still queued
+        message_writer.flush_pending(user_id=user_id)
         ChatMessage.query.filter(ChatMessage.chat_id.in_(
             db.session.query(ChatHistory.id).filter_by(user_id=user_id)
         )).delete()
@@ -381,17 +756,21 @@ def delete_account():
         db.session.delete(user)
         db.session.commit()
         
-        # Clear session
+        # Clear session, and sign out the user's other tabs on whichever process they are connected to
         session.clear()
+        socketio.emit('session_ended', {'reason': 'account_deleted'}, to=f'user:{user_id}')
         return jsonify({'message': 'Account deleted successfully'})
     except Exception as e:
         logger.error(f"Error deleting account: {str(e)}")
         return jsonify({'error': 'Error deleting account'}), 500
 
 if __name__ == '__main__':
+    # Exit normally on SIGTERM so queued chat messages are flushed by atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     # Check if running in production (cPanel)
     if os.environ.get('FLASK_ENV') == 'production':
-        # Production settings
+        # Production settings; serve.py runs the app on gevent or eventlet instead of Werkzeug
+        logger.warning("Running on the Werkzeug development server, use 'python serve.py' in production")
         port = int(os.environ.get('PORT', 5000))
         socketio.run(
             app,
@@ -401,8 +780,8 @@ if __name__ == '__main__':
             allow_unsafe_werkzeug=True
         )
     else:
-        # Development settings
-        port = find_available_port()
+        # Development settings, PORT picks the port of each process when running several
+        port = int(os.environ['PORT']) if os.environ.get('PORT') else find_available_port()
         print(f"Starting server on port {port}")
         print(f"Open http://localhost:{port} in your browser")
         socketio.run(
@@ -0,0 +1,137 @@
+"""Micro-benchmark for question classification and greeting detection.
+
+Compares the per-message cost of the original substring-scan implementation
+with the precompiled matcher in question_classifier.py, and shows how both
+scale as the keyword tables grow.
+
+    python benchmarks/bench_classifier.py
+    python benchmarks/bench_classifier.py --repeat 5000 --grow 1000 5000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from question_classifier import (  # noqa: E402
+    KEYWORD_CATEGORIES, CODE_KEYWORDS, EXPLANATION_KEYWORDS, COMPARISON_KEYWORDS,
+    TROUBLESHOOTING_KEYWORDS, TECHNICAL_CONTEXT_KEYWORDS, GREETINGS,
+    KeywordMatcher, classify_question, is_greeting
+)
+
+MESSAGES = [
+    "How to use MQTT with ESP32?",
+    "Explain IoT protocols",
+    "Show me sensor data analysis",
+    "What is the difference between LoRa and Zigbee for a farm monitoring network?",
+    "My Arduino keeps resetting when the relay switches the motor on, how do I fix it?",
+    "hi",
+    "Write a MicroPython script that reads a DHT22 every 10 seconds and publishes over MQTT",
+    "Which is better for battery powered nodes, BLE or WiFi?",
+    "tell me a joke",
+    "Can you recommend a cloud platform for storing time-series data from 500 devices?",
+]
+
+
+def legacy_analyze_question_type(message):
+    """The baseline algorithm: rebuild the tables, then substring-scan each keyword list"""
+    message = message.lower()
+    keyword_categories = {
+        group: {category: list(keywords) for category, keywords in categories.items()}
+        for group, categories in KEYWORD_CATEGORIES.items()
+    }
+    code_keywords = list(CODE_KEYWORDS)
+    explanation_keywords = list(EXPLANATION_KEYWORDS)
+    comparison_keywords = list(COMPARISON_KEYWORDS)
+    troubleshooting_keywords = list(TROUBLESHOOTING_KEYWORDS)
+
+    is_related = False
+    for group in ('iot_core', 'related_tech', 'applications'):
+        for category, keywords in keyword_categories[group].items():
+            if any(keyword in message for keyword in keywords):
+                is_related = True
+                break
+        if is_related:
+            break
+
+    if not is_related:
+        if any(word in message for word in list(TECHNICAL_CONTEXT_KEYWORDS)):
+            return 'general'
+        return 'non-technical'
+
+    if any(keyword in message for keyword in code_keywords):
+        return 'code'
+    elif any(keyword in message for keyword in explanation_keywords):
+        return 'explanation'
+    elif any(keyword in message for keyword in comparison_keywords):
+        return 'comparison'
+    elif any(keyword in message for keyword in troubleshooting_keywords):
+        return 'troubleshooting'
+    return 'general'
+
+
+def legacy_is_greeting(message):
+    greetings = list(GREETINGS)
+    message = message.lower().strip()
+    return any(greeting in message for greeting in greetings)
+
+
+def per_message_us(func, messages, repeat):
+    timer = timeit.Timer(lambda: [func(message) for message in messages])
+    best = min(timer.repeat(repeat=5, number=repeat))
+    return best / (repeat * len(messages)) * 1e6
+
+
+def random_keywords(count, seed=42):
+    rng = random.Random(seed)
+    return [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))) for _ in range(count)]
+
+
+def growth(extra_counts, messages, repeat):
+    """Per-message cost of a full-table scan vs the matcher as the tables grow"""
+    base = {category: keywords
+            for group in KEYWORD_CATEGORIES.values()
+            for category, keywords in group.items()}
+    rows = []
+    for extra in extra_counts:
+        table = dict(base, synthetic=random_keywords(extra))
+        keywords = [keyword for words in table.values() for keyword in words]
+        matcher = KeywordMatcher(table, inflections=True)
+
+        def scan(message):
+            message = message.lower()
+            return {keyword for keyword in keywords if keyword in message}
+
+        rows.append((len(keywords),
+                     per_message_us(scan, messages, repeat),
+                     per_message_us(matcher.match, messages, repeat)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000, help='passes over the message corpus per timing run')
+    parser.add_argument('--grow', type=int, nargs='*', default=[0, 1000, 10000],
+                        help='extra synthetic keywords for the scaling table')
+    args = parser.parse_args()
+
+    print(f"{'function':<24}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name, before, after in [
+        ('analyze_question_type', legacy_analyze_question_type, classify_question),
+        ('is_greeting', legacy_is_greeting, is_greeting),
+    ]:
+        before_us = per_message_us(before, MESSAGES, args.repeat)
+        after_us = per_message_us(after, MESSAGES, args.repeat)
+        print(f"{name:<24}{before_us:>14.2f}{after_us:>14.2f}{before_us / after_us:>9.1f}x")
+
+    print()
+    print(f"{'keywords':<24}{'scan (us)':>14}{'matcher (us)':>14}")
+    for count, scan_us, matcher_us in growth(args.grow, MESSAGES, max(args.repeat // 10, 1)):
+        print(f"{count:<24}{scan_us:>14.2f}{matcher_us:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Concurrency benchmark of the server's async modes.
+
+For each mode, starts serve.py against benchmarks/stub_llm.py, measures the
+server's memory and thread count idle and with many open websockets, then
+has some of the clients send messages for a while and reports the answers
+per second and their latency. Every mode gets the same SQLite database and
+upstream stub, so the difference is the server alone:
+
+    python benchmarks/bench_concurrency.py --modes threading,gevent --idle 1000 --active 50
+    python benchmarks/bench_concurrency.py --modes gevent --idle 5000 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import QUESTIONS  # noqa: E402
+from load_socketio import percentiles  # noqa: E402
+
+DATA_DIR = os.path.join(ROOT, 'benchmarks', 'data')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def wait_for_port(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with status {process.returncode} before listening")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout} s")
+
+
+def process_status(pid):
+    """Resident memory in MB and thread count of a process, from /proc (Linux only)"""
+    status = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                status[key] = value.split()
+    except OSError:
+        return {'rss_mb': None, 'threads': None}
+    return {'rss_mb': int(status['VmRSS'][0]) / 1024, 'threads': int(status['Threads'][0])}
+
+
+async def open_clients(url, count, concurrency):
+    """Connect count websocket clients, at most concurrency at a time; returns them and the failure count"""
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def connect():
+        nonlocal failures
+        async with semaphore:
+            client = socketio.AsyncClient(reconnection=False)
+            try:
+                await client.connect(url, transports=['websocket'], wait_timeout=30)
+                return client
+            except (socketio.exceptions.ConnectionError, asyncio.TimeoutError):
+                failures += 1
+                return None
+
+    clients = await asyncio.gather(*(connect() for _ in range(count)))
+    return [client for client in clients if client is not None], failures
+
+
+async def chat(client, index, deadline, timeout, latencies, counts):
+    """Send messages from one client until the deadline, one at a time"""
+    rng = random.Random(index)
+    replies = asyncio.Queue()
+    client.on('receive_message', lambda data: replies.put_nowait(data))
+    client.on('server_busy', lambda data: replies.put_nowait(dict(data, busy=True)))
+    chat_id = None
+    while time.monotonic() < deadline:
+        sent_at = time.perf_counter()
+        await client.emit('send_message', {'message': rng.choice(QUESTIONS), 'chat_id': chat_id,
+                                           'is_new_chat': chat_id is None})
+        counts['sent'] += 1
+        try:
+            data = await asyncio.wait_for(replies.get(), timeout)
+        except asyncio.TimeoutError:
+            counts['timeouts'] += 1
+            continue
+        if data.get('busy') or data.get('retry_after'):
+            counts['busy'] += 1
+            await asyncio.sleep(data.get('retry_after') or 1)
+            continue
+        if data.get('message') == 'Error processing message':
+            counts['errors'] += 1
+            continue
+        counts['answered'] += 1
+        latencies.append(time.perf_counter() - sent_at)
+        chat_id = data.get('chat_id') or chat_id
+
+
+async def measure(url, pid, args):
+    result = {'baseline': process_status(pid)}
+
+    started = time.perf_counter()
+    clients, failures = await open_clients(url, args.idle, args.connect_concurrency)
+    result['connect_s'] = time.perf_counter() - started
+    result['connected'] = len(clients)
+    result['connect_failures'] = failures
+    # Let the server settle after the burst of handshakes
+    await asyncio.sleep(2)
+    result['idle'] = process_status(pid)
+
+    latencies = []
+    counts = {'sent': 0, 'answered': 0, 'busy': 0, 'errors': 0, 'timeouts': 0}
+    active = clients[:args.active]
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.duration
+    await asyncio.gather(*(chat(client, i, deadline, args.timeout, latencies, counts)
+                           for i, client in enumerate(active)))
+    elapsed = time.perf_counter() - started
+    result['loaded'] = process_status(pid)
+    result['active_clients'] = len(active)
+    result['elapsed_s'] = elapsed
+    result['answers_per_second'] = counts['answered'] / elapsed
+    result['counts'] = counts
+    result['latency'] = percentiles(latencies)
+
+    await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+    return result
+
+
+def run_mode(mode, args, stub_url):
+    database = os.path.join(DATA_DIR, f'concurrency-{mode}.sqlite3')
+    if os.path.exists(database):
+        os.remove(database)
+    env = dict(
+        os.environ,
+        SOCKETIO_ASYNC_MODE=mode,
+        PORT=str(args.port),
+        HOST='127.0.0.1',
+        DATABASE_URL=f'sqlite:///{database}',
+        OPENAI_API_BASE=stub_url,
+        NETMIND_API_KEY='benchmark',
+        RATE_LIMIT_BACKEND='none',
+        RESPONSE_CACHE_BACKEND='none',
+        SIMILARITY_CACHE='false',
+        LLM_MAX_WORKERS=str(args.llm_workers),
+        UPSTREAM_POOL_SIZE=str(args.llm_workers),
+        LLM_QUEUE_DEPTH=str(max(args.active * 2, 32))
+    )
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'serve.py')], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.port, server)
+        return asyncio.run(measure(f'http://127.0.0.1:{args.port}', server.pid, args))
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='threading,gevent', help='comma-separated SOCKETIO_ASYNC_MODE values')
+    parser.add_argument('--idle', type=int, default=1000, help='websocket clients kept open')
+    parser.add_argument('--active', type=int, default=50, help='of those, clients that send messages')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds the active clients send messages')
+    parser.add_argument('--llm-workers', type=int, default=64, help='LLM_MAX_WORKERS for every mode')
+    parser.add_argument('--connect-concurrency', type=int, default=100, help='handshakes in flight at once')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--stub-port', type=int, default=8055)
+    parser.add_argument('--stub-latency', type=float, default=0.5)
+    parser.add_argument('--stub-answer-tokens', type=int, default=60)
+    parser.add_argument('--output', help='report path, default benchmarks/results/concurrency-<time>.json')
+    args = parser.parse_args()
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stub = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'stub_llm.py'),
+                             '--port', str(args.stub_port), '--latency', str(args.stub_latency),
+                             '--answer-tokens', str(args.stub_answer_tokens), '--tokens-per-second', '200'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {}
+    try:
+        wait_for_port(args.stub_port, stub)
+        for mode in args.modes.split(','):
+            print(f"{mode}: {args.idle} open websockets, {args.active} sending for {args.duration:.0f} s")
+            result = results[mode] = run_mode(mode, args, f'http://127.0.0.1:{args.stub_port}/v1')
+            idle, baseline = result['idle'], result['baseline']
+            print(f"  connected {result['connected']} in {result['connect_s']:.1f} s "
+                  f"({result['connect_failures']} failed)")
+            if idle['rss_mb'] is not None:
+                per_client = (idle['rss_mb'] - baseline['rss_mb']) * 1024 / max(result['connected'], 1)
+                print(f"  rss {baseline['rss_mb']:.0f} -> {idle['rss_mb']:.0f} MB ({per_client:.1f} KB a client), "
+                      f"threads {baseline['threads']} -> {idle['threads']}")
+            latency = result['latency'] or {}
+            print(f"  {result['answers_per_second']:.1f} answers/s, "
+                  f"p50 {latency.get('p50_ms', 0):.0f} ms, p95 {latency.get('p95_ms', 0):.0f} ms, "
+                  f"p99 {latency.get('p99_ms', 0):.0f} ms, " + ', '.join(f'{k} {v}' for k, v in result['counts'].items()))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'modes': results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"concurrency-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == '__main__':
+    main()
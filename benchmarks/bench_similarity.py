@@ -0,0 +1,113 @@
+"""Benchmark near-duplicate lookups in the MinHash/LSH similarity index.
+
+Fills the index with synthetic IoT questions, then times lookups of reworded
+stored questions (should hit) and of unseen questions (should miss).
+
+    python benchmarks/bench_similarity.py
+    python benchmarks/bench_similarity.py --entries 100000 --lookups 5000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from similarity_index import SimilarityIndex  # noqa: E402
+
+PARTS = ['dht22', 'dht11', 'bme280', 'bmp180', 'mpu6050', 'hc-sr04', 'ds18b20', 'ssd1306', 'neo-6m',
+         'ina219', 'max30102', 'pir', 'ldr', 'relay', 'servo', 'stepper', 'mcp2515', 'ads1115', 'sx1278',
+         'rc522', 'hx711', 'tcs34725', 'vl53l0x', 'ccs811', 'sgp30', 'mq135', 'tsl2561', 'ili9341']
+BOARDS = ['esp32', 'esp8266', 'arduino uno', 'arduino nano', 'raspberry pi', 'stm32', 'pico', 'nrf52840',
+          'teensy', 'esp32-c3', 'esp32-s3', 'attiny85', 'pi zero', 'jetson nano']
+ACTIONS = ['connect', 'wire', 'calibrate', 'read', 'power', 'debug', 'interface', 'configure']
+EXTRAS = ['over mqtt', 'with micropython', 'using platformio', 'on battery', 'with deep sleep',
+          'over lora', 'via i2c', 'via spi', 'with freertos', 'to home assistant', 'over ble', 'with esp-idf']
+TEMPLATES = [
+    'How do I {action} a {part} to {board} {extra}?',
+    'Best way to {action} {part} on {board} {extra}',
+    '{action} {part} sensor with an {board} {extra}',
+]
+
+
+def make_questions(count, parts, seed=7):
+    rng = random.Random(seed)
+    # Pseudo project words so that questions are not all near-copies of each other
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(5000)]
+    questions = []
+    for _ in range(count):
+        question = rng.choice(TEMPLATES).format(
+            action=rng.choice(ACTIONS), part=rng.choice(parts), board=rng.choice(BOARDS), extra=rng.choice(EXTRAS)
+        )
+        questions.append(question + ' for my ' + ' '.join(rng.sample(vocabulary, 3)) + ' project')
+    return questions
+
+
+def reword(question, rng):
+    """Drop a filler word and shuffle the word order a little"""
+    words = question.rstrip('?').split()
+    for filler in ('How', 'do', 'I', 'a', 'an', 'Best', 'way', 'to', 'my', 'for'):
+        if filler in words and rng.random() < 0.5:
+            words.remove(filler)
+    if len(words) > 3:
+        i = rng.randrange(len(words) - 1)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    return ' '.join(words).lower()
+
+
+def percentiles(samples):
+    values = np.array(samples) * 1e6
+    return {p: float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--threshold', type=float, default=0.85)
+    parser.add_argument('--num-perm', type=int, default=64)
+    parser.add_argument('--bands', type=int, default=16)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    # Unseen questions are about parts that never appear in the stored ones
+    stored = make_questions(args.entries, PARTS[:-4])
+    unseen = make_questions(args.lookups, PARTS[-4:], seed=8)
+    index = SimilarityIndex(threshold=args.threshold, max_entries=args.entries,
+                            num_perm=args.num_perm, bands=args.bands)
+
+    start = time.perf_counter()
+    for i, question in enumerate(stored):
+        index.add(question, f'key-{i}', scope='general')
+    insert_seconds = time.perf_counter() - start
+
+    def timed_lookups(queries):
+        timings, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(index.lookup(query, scope='general'))
+            timings.append(time.perf_counter() - start)
+        return timings, results
+
+    targets = rng.sample(range(args.entries), args.lookups)
+    hit_timings, hit_results = timed_lookups([reword(stored[i], rng) for i in targets])
+    correct = sum(1 for i, result in zip(targets, hit_results) if result and result[0] == f'key-{i}')
+    miss_timings, miss_results = timed_lookups(unseen)
+    false_hits = sum(1 for result in miss_results if result)
+
+    print(f"entries:            {len(index)}")
+    print(f"signature memory:   {index._signatures.nbytes / 1e6:.1f} MB")
+    print(f"insert:             {insert_seconds / args.entries * 1e6:.1f} us/question")
+    for name, timings in (('reworded lookup', hit_timings), ('unseen lookup', miss_timings)):
+        p = percentiles(timings)
+        print(f"{name + ':':<20}p50 {p[50]:.1f} us   p95 {p[95]:.1f} us   p99 {p[99]:.1f} us")
+    print(f"reworded found:     {correct / args.lookups:.1%}")
+    print(f"unseen matched:     {false_hits / args.lookups:.1%}")
+
+
+if __name__ == '__main__':
+    main()
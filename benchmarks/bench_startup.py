@@ -0,0 +1,202 @@
+"""Cold start benchmark: how long a fresh worker process takes to serve.
+
+Each run starts a new Python process, as Passenger does after a worker is
+recycled, and times importing app, the first page load and the first chat
+message (answered by benchmarks/stub_llm.py), with PREWARM off and on. The
+interpreter itself and the framework imports (Flask, Flask-SocketIO,
+SQLAlchemy) are timed separately, since the app cannot make those faster:
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --runs 5 --target-ms 300 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'benchmarks', 'data')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Timed inside the process, so interpreter start and shutdown are not counted
+FRAMEWORKS = """
+import time
+started = time.perf_counter()
+import flask, flask_socketio, flask_sqlalchemy, flask_login
+print((time.perf_counter() - started) * 1000)
+"""
+
+# Run in the fresh process; prints one JSON line of timings in milliseconds
+CHILD = """
+import json, os, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+status = client.get('/').status_code
+first_request = time.perf_counter()
+time.sleep(float(sys.argv[1]))
+sio = app.socketio.test_client(app.app, flask_test_client=client)
+sent = time.perf_counter()
+sio.emit('send_message', {'message': 'How do I connect a DHT22 sensor to an ESP32?', 'is_new_chat': True})
+answered = None
+while answered is None and time.perf_counter() - sent < 30:
+    if any(event['name'] == 'receive_message' for event in sio.get_received()):
+        answered = time.perf_counter()
+    else:
+        time.sleep(0.001)
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first_request - imported) * 1000,
+    'first_message_ms': (answered - sent) * 1000 if answered else None,
+    'status': status
+}))
+sys.stdout.flush()
+# Skip shutting down the background workers, only startup is measured
+os._exit(0)
+"""
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def wall_ms(code, env=None):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - started) * 1000
+
+
+def framework_import_ms(env):
+    completed = subprocess.run([sys.executable, '-c', FRAMEWORKS], cwd=ROOT, env=env, check=True,
+                               capture_output=True, text=True)
+    return float(completed.stdout.strip())
+
+
+def run_child(env, wait):
+    completed = subprocess.run([sys.executable, '-c', CHILD, str(wait)], cwd=ROOT, env=env,
+                               capture_output=True, text=True, timeout=120)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith('{')]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"Startup run failed:\n{completed.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def top_imports(env, count=10):
+    """The slowest modules imported by app, from python -X importtime"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env,
+                               capture_output=True, text=True)
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        # Direct imports of app, and of the top-level packages those pull in
+        if depth <= 2:
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return [{'module': name, 'cumulative_ms': ms} for ms, name in sorted(modules, reverse=True)[1:count + 1]]
+
+
+def summarize(samples):
+    samples = [sample for sample in samples if sample is not None]
+    if not samples:
+        return None
+    return {'median_ms': statistics.median(samples), 'min_ms': min(samples), 'max_ms': max(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes per variant')
+    parser.add_argument('--wait', type=float, default=1.0,
+                        help='seconds between the first page load and the first message')
+    parser.add_argument('--target-ms', type=float, default=300.0,
+                        help='budget from process start to the first response')
+    parser.add_argument('--stub-port', type=int, default=8056)
+    parser.add_argument('--output', help='report path, default benchmarks/results/startup-<time>.json')
+    args = parser.parse_args()
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    database = os.path.join(DATA_DIR, 'startup.sqlite3')
+    if os.path.exists(database):
+        os.remove(database)
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{database}',
+        OPENAI_API_BASE=f'http://127.0.0.1:{args.stub_port}/v1',
+        NETMIND_API_KEY='benchmark',
+        RESPONSE_CACHE_BACKEND='none',
+        RATE_LIMIT_BACKEND='none',
+        LOG_LEVEL='WARNING'
+    )
+    stub = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'stub_llm.py'),
+                             '--port', str(args.stub_port), '--latency', '0.05', '--jitter', '0',
+                             '--answer-tokens', '20', '--tokens-per-second', '1000'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        interpreter = [wall_ms('pass', env) for _ in range(args.runs)]
+        frameworks = [framework_import_ms(env) for _ in range(args.runs)]
+        # The first run creates the tables, as the first worker on a new database would
+        run_child(env, args.wait)
+        variants = {}
+        for prewarm in ('false', 'true'):
+            runs = [run_child(dict(env, PREWARM=prewarm), args.wait) for _ in range(args.runs)]
+            variants[f'prewarm={prewarm}'] = {
+                name: summarize([run[name] for run in runs])
+                for name in ('import_ms', 'first_request_ms', 'first_message_ms')
+            }
+        imports = top_imports(env)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    interpreter_ms = statistics.median(interpreter)
+    frameworks_ms = statistics.median(frameworks)
+    print(f"python startup {interpreter_ms:.0f} ms, framework imports {frameworks_ms:.0f} ms")
+    for variant, timings in variants.items():
+        import_ms = timings['import_ms']['median_ms']
+        first_request_ms = timings['first_request_ms']['median_ms']
+        to_first_response = interpreter_ms + import_ms + first_request_ms
+        # What the app adds on top of the interpreter and frameworks it runs on
+        own_ms = import_ms - frameworks_ms + first_request_ms
+        timings['to_first_response_ms'] = to_first_response
+        timings['app_own_ms'] = own_ms
+        first_message = timings['first_message_ms']
+        print(f"{variant}: import {import_ms:.0f} ms (min {timings['import_ms']['min_ms']:.0f}), "
+              f"first page {first_request_ms:.0f} ms, "
+              f"first message {first_message['median_ms'] if first_message else float('nan'):.0f} ms")
+        print(f"  to first response {to_first_response:.0f} ms "
+              f"({'within' if to_first_response <= args.target_ms else 'over'} {args.target_ms:.0f} ms), "
+              f"of which the app's own {own_ms:.0f} ms")
+    print("slowest imports: " + ', '.join(f"{entry['module']} {entry['cumulative_ms']:.0f} ms" for entry in imports[:5]))
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'interpreter_ms': interpreter_ms,
+        'framework_imports_ms': frameworks_ms,
+        'variants': variants,
+        'top_imports': imports
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == '__main__':
+    main()
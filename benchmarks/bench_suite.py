@@ -0,0 +1,229 @@
+"""Benchmark suite for the chatbot's hot paths, with results saved as JSON.
+
+Times question classification, greeting detection and the scope-note keyword
+check over the fixed corpus in benchmarks/corpus.py, and the chat history
+queries against a seeded SQLite database (10k users and 1M messages by
+default, built once and reused from benchmarks/data/).
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --compare benchmarks/results/baseline.json
+    python benchmarks/bench_suite.py --users 1000 --messages 100000 --only history
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask  # noqa: E402
+
+from corpus import CORPUS_VERSION, QUESTIONS, GREETINGS, ANSWERS  # noqa: E402
+from database import db, get_conversation_history, get_chat_messages  # noqa: E402
+from iot_chatbot import IoTChatbot  # noqa: E402
+
+DATA_DIR = os.path.join(ROOT, 'benchmarks', 'data')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+MESSAGES_PER_CHAT = 10
+
+
+def summarize(samples_ns):
+    """Latency summary in microseconds"""
+    samples = sorted(samples_ns)
+    count = len(samples)
+
+    def pick(fraction):
+        return samples[min(int(fraction * count), count - 1)] / 1000
+
+    return {
+        'calls': count,
+        'mean_us': sum(samples) / count / 1000,
+        'p50_us': pick(0.50),
+        'p95_us': pick(0.95),
+        'p99_us': pick(0.99),
+        'max_us': samples[-1] / 1000
+    }
+
+
+def time_calls(fn, inputs, repeat):
+    """Call fn once per input, repeat times over the inputs, timing every call"""
+    for value in inputs:
+        fn(value)  # warm up
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(repeat):
+        for value in inputs:
+            start = clock()
+            fn(value)
+            samples.append(clock() - start)
+    return summarize(samples)
+
+
+def seed_database(path, users, messages):
+    """Create the SQLite history database with the app's schema and deterministic data"""
+    app = make_app(path)
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    rng = random.Random(15)
+    chats_per_user = max(messages // (users * MESSAGES_PER_CHAT), 1)
+    start = datetime(2024, 1, 1)
+    fmt = '%Y-%m-%d %H:%M:%S.%f'
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (id, username, email, password, created_at) VALUES (?, ?, ?, ?, ?)",
+            ((i, f'user{i}', f'user{i}@example.com', 'benchmark', start.strftime(fmt)) for i in range(1, users + 1))
+        )
+
+        def chats():
+            chat_id = 0
+            for user_id in range(1, users + 1):
+                for n in range(chats_per_user):
+                    chat_id += 1
+                    yield chat_id, user_id, (start + timedelta(hours=chat_id)).strftime(fmt)
+
+        conn.executemany("INSERT INTO chat_history (id, user_id, created_at) VALUES (?, ?, ?)", chats())
+
+        def rows():
+            for i in range(messages):
+                chat_id = i // MESSAGES_PER_CHAT + 1
+                created_at = start + timedelta(hours=chat_id, seconds=i % MESSAGES_PER_CHAT)
+                yield chat_id, rng.choice(QUESTIONS), rng.choice(ANSWERS), created_at.strftime(fmt)
+
+        conn.executemany(
+            "INSERT INTO chat_messages (chat_id, user_message, bot_response, created_at) VALUES (?, ?, ?, ?)", rows()
+        )
+    conn.execute("ANALYZE")
+    conn.close()
+    return chats_per_user * users
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def history_database(users, messages):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f'history-{users}u-{messages}m.sqlite3')
+    if not os.path.exists(path):
+        print(f"Seeding {path} ({users} users, {messages} messages)...")
+        start = time.perf_counter()
+        try:
+            seed_database(path, users, messages)
+        except BaseException:
+            os.remove(path)
+            raise
+        print(f"Seeded in {time.perf_counter() - start:.1f} s")
+    return path
+
+
+def bench_text(repeat):
+    # Only the keyword matching is measured here, without the database or cache set up by IoTChatbot
+    chatbot = IoTChatbot.__new__(IoTChatbot)
+    return {
+        'analyze_question_type': time_calls(chatbot.analyze_question_type, QUESTIONS, repeat),
+        'is_greeting': time_calls(chatbot.is_greeting, QUESTIONS + GREETINGS, repeat),
+        'scope_note': time_calls(chatbot.scope_note, ANSWERS, repeat)
+    }
+
+
+def bench_history(users, messages, calls):
+    path = history_database(users, messages)
+    app = make_app(path)
+    rng = random.Random(16)
+    with app.app_context():
+        chat_count = db.session.execute(db.text("SELECT COUNT(*) FROM chat_history")).scalar()
+        user_ids = [rng.randint(1, users) for _ in range(calls)]
+        chat_ids = [rng.randint(1, chat_count) for _ in range(calls)]
+
+        def history(user_id):
+            get_conversation_history(user_id)
+            db.session.remove()
+
+        def page(chat_id):
+            get_chat_messages(chat_id, 50)
+            db.session.remove()
+
+        return {
+            'get_conversation_history': time_calls(history, user_ids, 1),
+            'get_chat_messages': time_calls(page, chat_ids, 1)
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['benchmarks']
+    print(f"\nChange against {baseline_path} (p50, negative is faster):")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['p50_us'], result['p50_us']
+        print(f"  {name:<26}{before:>10.1f} -> {after:>10.1f} us  {(after - before) / before:+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200, help='passes over the text corpus')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--calls', type=int, default=500, help='history queries per benchmark')
+    parser.add_argument('--only', choices=['text', 'history'])
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/<time>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    results = {}
+    if args.only in (None, 'text'):
+        results.update(bench_text(args.repeat))
+    if args.only in (None, 'history'):
+        results.update(bench_history(args.users, args.messages, args.calls))
+
+    for name, result in results.items():
+        print(f"{name:<26}p50 {result['p50_us']:>9.1f} us   p95 {result['p95_us']:>9.1f} us   "
+              f"p99 {result['p99_us']:>9.1f} us   ({result['calls']} calls)")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus_version': CORPUS_VERSION,
+        'parameters': vars(args),
+        'benchmarks': results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
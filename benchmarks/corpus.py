@@ -0,0 +1,117 @@
+"""Fixed corpus of chat messages and answers shared by the benchmarks.
+
+Keep it stable: results are only comparable between runs over the same corpus.
+Add new cases at the end and bump CORPUS_VERSION.
+"""
+
+CORPUS_VERSION = 1
+
+QUESTIONS = [
+    # Code
+    "Write a MicroPython script that reads a DHT22 every 10 seconds and publishes over MQTT",
+    "Show me Arduino code to read an HC-SR04 ultrasonic sensor and print the distance",
+    "Give me an ESP32 sketch that connects to WiFi and posts JSON to my REST API",
+    "Example code for an ESP8266 web server that toggles a relay",
+    "How do I implement OTA firmware updates on the ESP32 with ESP-IDF?",
+    "Write a Raspberry Pi Python program that logs BME280 readings to InfluxDB",
+    "Code for reading an MPU6050 over I2C with an STM32 using HAL",
+    "Can you write a FreeRTOS task that blinks an LED and reads a button with debouncing?",
+    "Show me how to use deep sleep on the ESP32 and wake up with a timer",
+    "Sample C code for SPI communication between two Arduinos",
+    "How to program an ATtiny85 to read a potentiometer and drive a servo",
+    "Write a Node-RED flow that stores MQTT sensor data in a database",
+    "Implement a LoRa sender and receiver with SX1278 modules on Arduino",
+    "How do I read a DS18B20 temperature sensor on a Raspberry Pi Pico with MicroPython?",
+    "Write a function to calculate a moving average of ADC samples on a microcontroller",
+    "Show me PlatformIO configuration for an ESP32-S3 with PSRAM enabled",
+    # Explanation
+    "Explain IoT protocols",
+    "What is MQTT and how does the publish subscribe model work?",
+    "Explain how I2C addressing works when several sensors share the bus",
+    "What is the difference between a microcontroller and a microprocessor?",
+    "How does LoRaWAN achieve long range with low power?",
+    "Explain what an RTOS is and when an embedded project needs one",
+    "What does QoS level 2 mean in MQTT?",
+    "How does a PID controller work for temperature regulation?",
+    "Explain pull-up resistors and why I2C needs them",
+    "What is edge computing in IoT?",
+    "Describe how BLE advertising and GATT services work",
+    "What is a watchdog timer and why should firmware use it?",
+    "Explain PWM and how it controls motor speed",
+    "How does Zigbee mesh networking route messages?",
+    # Comparison
+    "What is the difference between LoRa and Zigbee for a farm monitoring network?",
+    "Which is better for battery powered nodes, BLE or WiFi?",
+    "ESP32 vs Raspberry Pi Pico W for a home automation sensor",
+    "Compare MQTT and CoAP for constrained devices",
+    "Arduino Uno vs STM32 Blue Pill for a robotics project",
+    "Should I use NB-IoT or LTE-M for asset tracking?",
+    "AWS IoT Core versus Azure IoT Hub for 10,000 devices",
+    "Compare SPI and I2C for connecting a display",
+    "Which is faster for logging, an SD card or SPI flash?",
+    "Thread vs Zigbee for smart home devices",
+    # Troubleshooting
+    "My Arduino keeps resetting when the relay switches the motor on, how do I fix it?",
+    "ESP32 brownout detector was triggered, what causes this?",
+    "I2C scanner finds no devices on my Raspberry Pi, what should I check?",
+    "MQTT client keeps disconnecting every few minutes from Mosquitto",
+    "My DHT22 returns NaN readings intermittently",
+    "ESP8266 fails to connect to WiFi after deep sleep",
+    "Why does my servo jitter when powered from the Arduino 5V pin?",
+    "LoRa packets are lost beyond 500 meters, how can I debug this?",
+    "STM32 hard fault after enabling the DMA, how to find the cause?",
+    "Getting garbage characters on the serial monitor",
+    "My battery powered sensor drains the battery in two days",
+    "Upload fails with 'timed out waiting for packet header' on ESP32",
+    # Project ideas and general IoT
+    "Show me sensor data analysis",
+    "Can you recommend a cloud platform for storing time-series data from 500 devices?",
+    "Ideas for an IoT project for a smart greenhouse",
+    "How do I design a low power soil moisture sensor network?",
+    "What sensors do I need for an indoor air quality monitor?",
+    "How should I secure MQTT communication between my devices and the broker?",
+    "Plan a home energy monitoring system with current sensors",
+    "How can I visualize sensor data from Home Assistant in Grafana?",
+    "What is the best way to provision certificates on thousands of devices?",
+    "How do I estimate battery life for a device that wakes every 15 minutes?",
+    "Architecture for a fleet of vending machines reporting stock levels",
+    "How do I use machine learning on a microcontroller for anomaly detection?",
+    # Off-topic and short messages
+    "tell me a joke",
+    "What is the capital of France?",
+    "Recommend a good book about history",
+    "How do I make pancakes?",
+    "thanks, that helped",
+    "ok",
+]
+
+GREETINGS = [
+    "hi",
+    "Hello!",
+    "hey there",
+    "good morning",
+    "Hi, how are you?",
+    "greetings",
+    "hello, I need help with my ESP32",
+    "hey",
+]
+
+# Answers for the scope-note keyword check: on-topic ones stop at the first keyword,
+# off-topic ones scan every keyword
+ANSWERS = [
+    "To publish sensor readings over MQTT, connect the ESP32 to WiFi, create a client with the broker "
+    "address and call publish on a topic such as home/livingroom/temperature every few seconds.",
+    "The DHT22 needs a 10k pull-up resistor on the data line. Read it no more than once every two seconds, "
+    "otherwise the sensor returns stale values or NaN.",
+    "LoRa trades data rate for range: a higher spreading factor makes each packet longer on air but lets the "
+    "receiver decode it far below the noise floor.",
+    "Use a flyback diode across the relay coil and power the motor from a separate supply so the "
+    "microcontroller does not brown out when it switches.",
+    "Paris is the capital of France. It has been the country's capital for most of its history and is "
+    "known for the Eiffel Tower, the Louvre and its cafes.",
+    "Mix flour, milk, eggs and a pinch of salt into a smooth batter, let it rest for half an hour, then "
+    "cook thin layers in a hot buttered pan until golden on both sides.",
+    "Why did the scarecrow win an award? Because he was outstanding in his field.",
+    "A classic choice is Guns, Germs, and Steel, which looks at why some societies came to dominate others "
+    "over thousands of years of history.",
+]
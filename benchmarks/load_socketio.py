@@ -0,0 +1,202 @@
+"""End-to-end load generator for the Socket.IO chat flow.
+
+Opens N concurrent clients against a running app. Each client logs in
+(registering its load-test account on first use), sends messages from the
+benchmark corpus with send_message, waits for receive_message, then reloads
+the chat with load_chat. Reports throughput and latency percentiles, and can
+save them as JSON. Run the app against benchmarks/stub_llm.py so upstream
+latency is controlled:
+
+    python benchmarks/load_socketio.py --url http://127.0.0.1:5000 --clients 50 --messages 10
+    python benchmarks/load_socketio.py --clients 20 --guests --output load.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import QUESTIONS  # noqa: E402
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {'message': [], 'first_chunk': [], 'load_chat': []}
+        self.counts = {'sent': 0, 'answered': 0, 'busy': 0, 'rate_limited': 0, 'errors': 0, 'timeouts': 0,
+                       'login_failures': 0}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.latency[name].append(seconds)
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+def login(session, url, index):
+    """Log the HTTP session in as load-test user index, registering it first if needed"""
+    email = f'loadtest{index}@example.com'
+    password = 'loadtest-password'
+    form = {'email': email, 'password': password}
+    if session.post(f'{url}/login', data=form, allow_redirects=False).status_code == 302:
+        return True
+    session.post(f'{url}/register', data={'username': f'loadtest{index}', **form}, allow_redirects=False)
+    return session.post(f'{url}/login', data=form, allow_redirects=False).status_code == 302
+
+
+def run_client(index, args, results, start_barrier):
+    rng = random.Random(index)
+    session = requests.Session()
+    logged_in = not args.guests and login(session, args.url, index)
+    if not args.guests and not logged_in:
+        results.count('login_failures')
+
+    sio = socketio.Client(http_session=session, reconnection=False)
+    answer = threading.Event()
+    loaded = threading.Event()
+    state = {'first_chunk': None, 'message': None}
+
+    @sio.on('receive_chunk')
+    def on_chunk(data):
+        if state['first_chunk'] is None:
+            state['first_chunk'] = time.perf_counter()
+
+    @sio.on('receive_message')
+    def on_message(data):
+        state['message'] = data
+        answer.set()
+
+    @sio.on('server_busy')
+    def on_busy(data):
+        state['message'] = dict(data, busy=True)
+        answer.set()
+
+    @sio.on('chat_loaded')
+    def on_chat_loaded(data):
+        loaded.set()
+
+    start_barrier.wait()
+    time.sleep(rng.uniform(0, args.ramp))
+    try:
+        sio.connect(args.url, transports=args.transports.split(','))
+    except socketio.exceptions.ConnectionError:
+        results.count('errors')
+        return
+
+    chat_id = None
+    try:
+        for n in range(args.messages):
+            answer.clear()
+            state['first_chunk'] = None
+            state['message'] = None
+            sent_at = time.perf_counter()
+            sio.emit('send_message', {
+                'message': rng.choice(QUESTIONS),
+                'chat_id': chat_id,
+                'is_new_chat': chat_id is None
+            })
+            results.count('sent')
+            if not answer.wait(args.timeout):
+                results.count('timeouts')
+                continue
+            received_at = time.perf_counter()
+            data = state['message'] or {}
+            if data.get('busy'):
+                results.count('busy')
+                continue
+            if data.get('retry_after'):
+                results.count('rate_limited')
+                continue
+            if data.get('message') == 'Error processing message':
+                results.count('errors')
+                continue
+            results.count('answered')
+            results.observe('message', received_at - sent_at)
+            if state['first_chunk'] is not None:
+                results.observe('first_chunk', state['first_chunk'] - sent_at)
+            chat_id = data.get('chat_id') or chat_id
+
+            if logged_in and chat_id:
+                loaded.clear()
+                load_started = time.perf_counter()
+                sio.emit('load_chat', {'chat_id': chat_id})
+                if loaded.wait(args.timeout):
+                    results.observe('load_chat', time.perf_counter() - load_started)
+                else:
+                    results.count('timeouts')
+            if args.think_time:
+                time.sleep(rng.uniform(0, 2 * args.think_time))
+    finally:
+        sio.disconnect()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return None
+
+    def pick(fraction):
+        return samples[min(int(fraction * len(samples)), len(samples) - 1)] * 1000
+
+    return {'count': len(samples), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99),
+            'max_ms': samples[-1] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=5, help='messages sent by each client')
+    parser.add_argument('--guests', action='store_true', help='send messages without logging in')
+    parser.add_argument('--ramp', type=float, default=2.0, help='seconds over which clients connect')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean seconds between messages')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--transports', default='websocket', help='e.g. websocket or polling')
+    parser.add_argument('--output', help='save the report as JSON')
+    args = parser.parse_args()
+
+    results = Results()
+    barrier = threading.Barrier(args.clients + 1)
+    threads = [threading.Thread(target=run_client, args=(i, args, results, barrier), daemon=True)
+               for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'parameters': vars(args),
+        'elapsed_s': elapsed,
+        'messages_per_second': results.counts['answered'] / elapsed,
+        'counts': results.counts,
+        'latency': {name: percentiles(samples) for name, samples in results.latency.items()}
+    }
+
+    print(f"clients {args.clients}, {elapsed:.1f} s, {report['messages_per_second']:.2f} answers/s")
+    print('  ' + ', '.join(f'{name} {count}' for name, count in results.counts.items()))
+    for name, summary in report['latency'].items():
+        if summary:
+            print(f"  {name:<12}p50 {summary['p50_ms']:>8.0f} ms   p95 {summary['p95_ms']:>8.0f} ms   "
+                  f"p99 {summary['p99_ms']:>8.0f} ms   ({summary['count']})")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.output}")
+
+
+if __name__ == '__main__':
+    main()
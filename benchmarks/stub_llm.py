@@ -0,0 +1,173 @@
+"""OpenAI-compatible stub of the upstream chat completion API, for load tests.
+
+Answers POST /chat/completions (and /v1/chat/completions) with generated IoT
+text, streamed as server-sent events or as one JSON body, after a configurable
+delay and at a configurable token rate. A fraction of requests can be made to
+fail, or every request for given models, and a fraction can be made slow to
+give the latency a long tail. Point the app at it with OPENAI_API_BASE:
+
+    python benchmarks/stub_llm.py --port 8001 --latency 0.4 --tokens-per-second 60
+    OPENAI_API_BASE=http://127.0.0.1:8001/v1 python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ('the sensor publishes readings over MQTT to the broker while the ESP32 sleeps between samples '
+         'and the gateway forwards data to the cloud dashboard for monitoring and automation of each device '
+         'so check the wiring pull-up resistor power supply and firmware configuration before deployment').split()
+
+
+class StubSettings:
+    def __init__(self, latency, jitter, tokens_per_second, answer_tokens, error_rate, error_status, fail_models=(),
+                 slow_rate=0.0, slow_latency=5.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_models = set(fail_models)
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('', '/health'):
+            with self.settings.lock:
+                self._send_json(200, {'requests': self.settings.requests, 'errors': self.settings.errors})
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/chat/completions', '/v1/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+            return
+
+        settings = self.settings
+        fail = random.random() < settings.error_rate or request.get('model') in settings.fail_models
+        with settings.lock:
+            settings.requests += 1
+            settings.errors += fail
+        latency = settings.slow_latency if random.random() < settings.slow_rate else settings.latency
+        time.sleep(max(latency + random.uniform(-settings.jitter, settings.jitter), 0))
+        if fail:
+            self._send_json(settings.error_status, {'error': {'message': 'Injected upstream error', 'type': 'server_error'}})
+            return
+
+        count = min(settings.answer_tokens, int(request.get('max_tokens') or settings.answer_tokens))
+        tokens = [random.choice(WORDS) + ' ' for _ in range(count)]
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:24]}'
+        model = request.get('model', 'stub')
+        if request.get('stream'):
+            self._stream(completion_id, model, tokens)
+        else:
+            time.sleep(count / settings.tokens_per_second)
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                    'finish_reason': 'length' if count < settings.answer_tokens else 'stop'
+                }],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': count, 'total_tokens': count}
+            })
+
+    def _stream(self, completion_id, model, tokens):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        # Chunked like the real providers, so the connection stays open for the next request
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+
+        interval = 1 / self.settings.tokens_per_second
+        try:
+            event({'role': 'assistant'})
+            for token in tokens:
+                time.sleep(interval)
+                event({'content': token})
+            event({}, 'length' if len(tokens) < self.settings.answer_tokens else 'stop')
+            write_chunk(b"data: [DONE]\n\n")
+            write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, as the app does when a generation is stopped
+            self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds before the first token')
+    parser.add_argument('--jitter', type=float, default=0.1, help='+/- seconds of random extra latency')
+    parser.add_argument('--tokens-per-second', type=float, default=50)
+    parser.add_argument('--answer-tokens', type=int, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--fail-model', action='append', default=[],
+                        help='model that always fails, to exercise fallbacks (repeatable)')
+    parser.add_argument('--slow-rate', type=float, default=0.0,
+                        help='fraction of requests that wait --slow-latency instead, to exercise hedging')
+    parser.add_argument('--slow-latency', type=float, default=5.0)
+    args = parser.parse_args()
+
+    StubHandler.settings = StubSettings(args.latency, args.jitter, args.tokens_per_second,
+                                        args.answer_tokens, args.error_rate, args.error_status, args.fail_model,
+                                        args.slow_rate, args.slow_latency)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stub LLM listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
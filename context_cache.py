@@ -0,0 +1,95 @@
+import time
+import threading
+from collections import OrderedDict, deque
+
+from token_budget import estimate_tokens, truncate_to_tokens
+
+
+class ConversationContextCache:
+    """Bounded in-memory cache of the recent turns of each chat.
+
+    Each cached chat keeps at most ``max_turns`` (user, assistant) pairs. On a
+    miss the window is loaded once through ``loader(chat_id, limit)``, which
+    returns pairs oldest first; after that, turns written by this process are
+    appended in place and other writers are picked up when the entry expires
+    after ``ttl`` seconds or is invalidated. At most ``max_chats`` chats are
+    kept, least recently used first out.
+    """
+
+    def __init__(self, loader, max_chats=1000, max_turns=20, token_budget=2000, ttl=900):
+        self.loader = loader
+        self.max_chats = max_chats
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.ttl = ttl
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached_turns(self, chat_id):
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None:
+                return None
+            loaded_at, turns = entry
+            if loaded_at + self.ttl < time.time():
+                del self._chats[chat_id]
+                return None
+            self._chats.move_to_end(chat_id)
+            return list(turns)
+
+    def _store(self, chat_id, turns):
+        with self._lock:
+            self._chats[chat_id] = (time.time(), deque(turns, maxlen=self.max_turns))
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+    def get_history(self, chat_id):
+        """Return the chat's recent turns as chat completion messages, trimmed to the token budget"""
+        turns = self._cached_turns(chat_id)
+        if turns is None:
+            turns = list(self.loader(chat_id, self.max_turns))
+            self._store(chat_id, turns)
+        return self.build_messages(turns)
+
+    def build_messages(self, turns):
+        """Keep the newest turns that fit the budget and summarise the rest in one short note"""
+        # A single long answer may not take more than half of the budget
+        turn_limit = max(self.token_budget // 2, 1)
+        summary_budget = self.token_budget // 10
+        remaining = self.token_budget - summary_budget
+        kept = []
+        dropped = 0
+        for user_message, bot_response in reversed(turns):
+            user_message = truncate_to_tokens(user_message, turn_limit)
+            bot_response = truncate_to_tokens(bot_response, turn_limit)
+            cost = estimate_tokens(user_message) + estimate_tokens(bot_response)
+            if cost > remaining:
+                dropped = len(turns) - len(kept)
+                break
+            remaining -= cost
+            kept.append((user_message, bot_response))
+        kept.reverse()
+
+        messages = []
+        if dropped and summary_budget:
+            earlier = '; '.join(truncate_to_tokens(user_message, 20) for user_message, _ in turns[:dropped])
+            messages.append({
+                'role': 'system',
+                'content': truncate_to_tokens(f"Earlier in this conversation the user asked about: {earlier}", summary_budget)
+            })
+        for user_message, bot_response in kept:
+            messages.append({'role': 'user', 'content': user_message})
+            messages.append({'role': 'assistant', 'content': bot_response})
+        return messages
+
+    def record_turn(self, chat_id, user_message, bot_response):
+        """Append a turn that was just saved to a cached chat"""
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is not None:
+                entry[1].append((user_message, bot_response))
+
+    def invalidate(self, chat_id):
+        with self._lock:
+            self._chats.pop(chat_id, None)
@@ -1,23 +1,94 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask import current_app
+from sqlalchemy.orm import Session
 from datetime import datetime
+from contextlib import contextmanager
+from collections import OrderedDict
 import os
-from dotenv import load_dotenv
+import time
+import threading
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
-# Load environment variables
-load_dotenv()
-
 db = SQLAlchemy()
 
+# Bind key of the optional read replica in SQLALCHEMY_BINDS
+REPLICA_BIND = 'replica'
+
+class RecentWrites:
+    """Remember when chats and users were last written in this process.
+    
+    History reads for a chat or user written within the replica lag window
+    go to the primary, so people always see the messages they just sent.
+    Only the most recent ``max_keys`` writes are remembered. The marks are
+    per process: with several workers, a read handled by another process than
+    the one that wrote still goes to the replica and may miss the write,
+    unless sticky sessions keep a user on one process.
+    """
+    
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._written_at = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def record(self, chat_id=None, user_id=None):
+        now = time.monotonic()
+        with self._lock:
+            for key in (('chat', chat_id), ('user', user_id)):
+                if key[1] is None:
+                    continue
+                self._written_at[key] = now
+                self._written_at.move_to_end(key)
+            while len(self._written_at) > self.max_keys:
+                self._written_at.popitem(last=False)
+    
+    def written_within(self, seconds, chat_id=None, user_id=None):
+        cutoff = time.monotonic() - seconds
+        with self._lock:
+            return any(self._written_at.get(key, cutoff) > cutoff
+                       for key in (('chat', chat_id), ('user', user_id)) if key[1] is not None)
+
+recent_writes = RecentWrites()
+
+@contextmanager
+def read_session(chat_id=None, user_id=None):
+    """Session for read-only history queries.
+    
+    Uses the replica bound under REPLICA_BIND when one is configured, unless
+    the chat or user was written within REPLICA_LAG_WINDOW seconds; otherwise
+    the regular primary session.
+    """
+    engine = db.engines.get(REPLICA_BIND)
+    lag_window = current_app.config.get('REPLICA_LAG_WINDOW', 5)
+    if engine is None or recent_writes.written_within(lag_window, chat_id=chat_id, user_id=user_id):
+        yield db.session
+        return
+    with Session(engine) as session:
+        yield session
+
 class Database:
     def __init__(self):
         self.db = db
+        # Optional persistence.WriteBehindQueue for message inserts
+        self.writer = None
+        self._tables_created = False
+        self._tables_lock = threading.Lock()
 
-    def init_app(self, app):
+    def init_app(self, app, create_tables=True):
+        """Bind the app; with create_tables=False the schema check waits for create_tables()"""
         db.init_app(app)
-        with app.app_context():
-            db.create_all()
+        if create_tables:
+            self.create_tables(app)
+
+    def create_tables(self, app):
+        """Create any missing tables, once per process; later calls return straight away"""
+        if self._tables_created:
+            return
+        with self._tables_lock:
+            if not self._tables_created:
+                with app.app_context():
+                    db.create_all()
+                self._tables_created = True
 
     def get_session(self):
         return db.session
@@ -25,27 +96,39 @@ class Database:
     def close(self):
         db.session.close()
 
-    def save_conversation(self, user_message, bot_response, model_used, question_type, user_id=None):
+    def save_conversation(self, user_message, bot_response, model_used, question_type, user_id=None, chat_id=None):
+        """Save a message to the given chat, or to the user's latest chat.
+        
+        The message goes through the write-behind queue when one is attached,
+        so the caller does not wait for the commit.
+        """
         if user_id is None:
             print("Error: user_id is required")
             return False
             
         try:
             # Get or create chat history
-            chat = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.created_at.desc()).first()
-            if not chat:
-                chat = ChatHistory(user_id=user_id)
-                self.db.session.add(chat)
-                self.db.session.commit()
+            if chat_id is None:
+                chat = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.created_at.desc()).first()
+                if not chat:
+                    chat = ChatHistory(user_id=user_id)
+                    self.db.session.add(chat)
+                    self.db.session.commit()
+                chat_id = chat.id
+            
+            if self.writer is not None:
+                self.writer.enqueue(chat_id, user_message, bot_response, user_id=user_id)
+                return True
             
             # Save message
             message = ChatMessage(
-                chat_id=chat.id,
+                chat_id=chat_id,
                 user_message=user_message,
                 bot_response=bot_response
             )
             self.db.session.add(message)
             self.db.session.commit()
+            recent_writes.record(chat_id=chat_id, user_id=user_id)
             return True
         except Exception as e:
             self.db.session.rollback()
@@ -75,6 +158,9 @@ class User(db.Model):
 
 class ChatHistory(db.Model):
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        db.Index('ix_chat_history_user_id_created_at', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -88,6 +174,9 @@ class ChatHistory(db.Model):
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_chat_id_created_at', 'chat_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     chat_id = db.Column(db.Integer, db.ForeignKey('chat_history.id'), nullable=False)
@@ -117,28 +206,81 @@ def verify_user(email, password):
         return None
 
 def get_conversation_history(user_id):
+    # None rather than [] on an error, so a failed read is not cached as an empty sidebar
     try:
-        # Get all chat histories for the user, ordered by most recent first
-        chats = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.created_at.desc()).all()
-        
-        # Format the chat histories
-        history = []
-        for chat in chats:
-            # Get the most recent message for preview
-            last_message = ChatMessage.query.filter_by(chat_id=chat.id).order_by(ChatMessage.created_at.desc()).first()
-            if last_message:
-                history.append({
-                    'id': chat.id,
-                    'user_message': last_message.user_message,
-                    'bot_response': last_message.bot_response,
-                    'timestamp': chat.created_at.strftime('%Y-%m-%d %H:%M'),
-                    'message_count': ChatMessage.query.filter_by(chat_id=chat.id).count()
-                })
-        
-        return history
+        with read_session(user_id=user_id) as session:
+            return _conversation_history(session, user_id)
     except Exception as e:
         print(f"Error getting conversation history: {str(e)}")
-        return []
+        return None
+
+def _conversation_history(session, user_id):
+    # Last message id and message count of every chat, in one grouped pass.
+    # Ids grow with insertion order, so the highest id is the most recent message.
+    latest = session.query(
+        ChatMessage.chat_id.label('chat_id'),
+        db.func.max(ChatMessage.id).label('last_message_id'),
+        db.func.count(ChatMessage.id).label('message_count')
+    ).join(ChatHistory, ChatHistory.id == ChatMessage.chat_id) \
+        .filter(ChatHistory.user_id == user_id) \
+        .group_by(ChatMessage.chat_id) \
+        .subquery()
+    
+    # Get all chat histories that have messages, ordered by most recent first
+    chats = session.query(
+        ChatHistory.id,
+        ChatHistory.created_at,
+        ChatMessage.user_message,
+        ChatMessage.bot_response,
+        latest.c.message_count
+    ).join(latest, latest.c.chat_id == ChatHistory.id) \
+        .join(ChatMessage, ChatMessage.id == latest.c.last_message_id) \
+        .filter(ChatHistory.user_id == user_id) \
+        .order_by(ChatHistory.created_at.desc()) \
+        .all()
+    
+    # Format the chat histories
+    return [{
+        'id': chat.id,
+        'user_message': chat.user_message,
+        'bot_response': chat.bot_response,
+        'timestamp': chat.created_at.strftime('%Y-%m-%d %H:%M'),
+        'message_count': chat.message_count
+    } for chat in chats]
+
+def encode_cursor(message):
+    """Cursor pointing just before a message, for fetching the page of older ones"""
+    return f"{message.created_at.isoformat()}_{message.id}"
+
+def decode_cursor(cursor):
+    created_at, message_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(created_at), int(message_id)
+
+def get_chat_messages(chat_id, limit=50, before=None):
+    """Get the most recent messages of a chat older than the cursor.
+    
+    Returns the page oldest first and the cursor of the next older page, or None
+    if this page reaches the start of the chat. Raises ValueError for a bad cursor.
+    """
+    before = decode_cursor(before) if before else None
+    with read_session(chat_id=chat_id) as session:
+        return _chat_messages(session, chat_id, limit, before)
+
+def _chat_messages(session, chat_id, limit, before):
+    query = session.query(ChatMessage).filter_by(chat_id=chat_id)
+    if before:
+        created_at, message_id = before
+        # Keyset on (created_at, id) so the page is found through the index, not an OFFSET scan
+        query = query.filter(db.or_(
+            ChatMessage.created_at < created_at,
+            db.and_(ChatMessage.created_at == created_at, ChatMessage.id < message_id)
+        ))
+    
+    messages = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(messages[limit - 1]) if len(messages) > limit else None
+    messages = messages[:limit]
+    messages.reverse()
+    return messages, next_cursor
 
 def init_app(app):
     db.init_app(app)
@@ -0,0 +1,216 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+from metrics import HEDGES_FIRED, HEDGES_WON
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeHandle:
+    """Lets a running attempt be cancelled by closing whatever it registered"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Error cancelling hedged attempt: {str(e)}")
+
+
+class StopEvent(threading.Event):
+    """A threading.Event that also runs callbacks when set.
+
+    Polling is_set() only notices a stop between chunks; a callback can close
+    the connection a worker is blocked on, e.g. while it waits for the first
+    chunk of a slow answer.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def on_set(self, callback):
+        """Run callback once the event is set, or right away if it already is"""
+        with self._callbacks_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def set(self):
+        with self._callbacks_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Error running stop callback: {str(e)}")
+
+
+def cancel_on_stop(stop_event, handle):
+    """Cancel handle when stop_event is set; a plain threading.Event can only be polled, so it is ignored"""
+    if isinstance(stop_event, StopEvent):
+        stop_event.on_set(handle.cancel)
+    return handle
+
+
+class _Attempt:
+    def __init__(self, fn, hedge):
+        self.fn = fn
+        self.hedge = hedge
+        self.handle = HedgeHandle()
+        self.result = None
+        self.error = None
+        self.finished = False
+
+
+class Hedger:
+    """Send a second request when the first one is slow, and keep whichever answers first.
+
+    ``run(primary, hedge)`` calls ``primary(handle)``; if it has not returned
+    after the hedge delay, ``hedge(handle)`` is started too. The first attempt
+    to succeed wins and the other one is cancelled through its handle. The
+    delay is fixed, or when ``delay`` is None the ``quantile`` of the last
+    ``window`` latencies (never below ``min_delay``). At most ``max_rate`` of
+    the requests are hedged, with a little burst allowance.
+    """
+
+    def __init__(self, delay=None, quantile=0.95, min_delay=0.25, max_rate=0.1, window=200,
+                 min_samples=20, spawn=None):
+        self.delay = delay
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self._spawn = spawn or self._spawn_thread
+        self._latencies = deque(maxlen=window)
+        self._budget = 1.0
+        self._lock = threading.Lock()
+        self.fired = 0
+        self.won = 0
+
+    @staticmethod
+    def _spawn_thread(target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def current_delay(self):
+        """Seconds to wait before hedging, or None while too few latencies have been seen"""
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return max(ordered[min(int(self.quantile * len(ordered)), len(ordered) - 1)], self.min_delay)
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _take_hedge(self):
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            self.fired += 1
+            return True
+
+    def run(self, primary, hedge=None, stop_event=None):
+        """Return the result of the first attempt to succeed; raises the primary's error if both fail.
+
+        Setting a StopEvent given as stop_event cancels every attempt.
+        """
+        with self._lock:
+            # Every request earns max_rate of a hedge, so at most that share are hedged over time
+            self._budget = min(self._budget + self.max_rate, 1 + self.max_rate * 10)
+        delay = self.current_delay() if hedge is not None else None
+        start = time.perf_counter()
+        if delay is None:
+            result = primary(cancel_on_stop(stop_event, HedgeHandle()))
+            self.record_latency(time.perf_counter() - start)
+            return result
+
+        cond = threading.Condition()
+        attempts = []
+
+        def launch(fn, is_hedge):
+            attempt = _Attempt(fn, is_hedge)
+            attempts.append(attempt)
+            cancel_on_stop(stop_event, attempt.handle)
+
+            def target():
+                try:
+                    attempt.result = attempt.fn(attempt.handle)
+                except Exception as e:
+                    attempt.error = e
+                with cond:
+                    attempt.finished = True
+                    cond.notify_all()
+
+            self._spawn(target)
+
+        def winner():
+            return next((a for a in attempts if a.finished and a.error is None), None)
+
+        with cond:
+            launch(primary, False)
+            cond.wait_for(lambda: attempts[0].finished, timeout=delay)
+            if not attempts[0].finished and self._take_hedge():
+                HEDGES_FIRED.inc()
+                launch(hedge, True)
+            cond.wait_for(lambda: winner() is not None or all(a.finished for a in attempts))
+            won = winner()
+
+        for attempt in attempts:
+            if attempt is not won:
+                attempt.handle.cancel()
+        if won is None:
+            raise attempts[0].error
+        if won.hedge:
+            HEDGES_WON.inc()
+            with self._lock:
+                self.won += 1
+        self.record_latency(time.perf_counter() - start)
+        return won.result
+
+    def stats(self):
+        with self._lock:
+            return {'fired': self.fired, 'won': self.won, 'delay': self.delay, 'samples': len(self._latencies)}
+
+
+def create_hedger(spawn=None):
+    """Build the hedger configured by the HEDGE_* environment variables, or None if hedging is off"""
+    if os.getenv('HEDGE_REQUESTS', 'false').lower() != 'true':
+        return None
+    delay = os.getenv('HEDGE_DELAY', 'auto').strip().lower()
+    return Hedger(
+        delay=None if delay == 'auto' else float(delay),
+        quantile=float(os.getenv('HEDGE_QUANTILE', 0.95)),
+        min_delay=float(os.getenv('HEDGE_MIN_DELAY', 0.25)),
+        max_rate=float(os.getenv('HEDGE_MAX_RATE', 0.1)),
+        spawn=spawn
+    )
@@ -1,122 +1,48 @@
-import openai
 import os
-from dotenv import load_dotenv
 import re
 import logging
-from database import Database
-from flask import Flask, request, jsonify, render_template
+from question_classifier import classify_question, is_greeting
+from response_cache import create_response_cache
+from prompt_templates import PromptRegistry
+from upstream_client import create_upstream_client, UpstreamError
+from model_router import create_model_router
+from hedging import create_hedger, cancel_on_stop, HedgeHandle
+from token_budget import create_output_budget, estimate_tokens
+import itertools
+from metrics import (
+    timed, UPSTREAM_SECONDS, FIRST_TOKEN_SECONDS, CLASSIFY_SECONDS, CACHE_LOOKUPS, ERRORS, MODEL_FALLBACKS,
+    ANSWER_TOKENS, TRUNCATED_ANSWERS
+)
+import time
 from datetime import datetime
 
-# Load environment variables
-load_dotenv()
-
-# Set the API configuration
-openai.api_base = "https://api.netmind.ai/inference-api/openai/v1"
-openai.api_key = os.getenv("NETMIND_API_KEY")
-
-app = Flask(__name__)
-chatbot = None
+# Sent after a cut-off answer to have the model pick it up again
+CONTINUE_PROMPT = "Your previous answer was cut off. Continue it exactly where it stopped, without repeating anything."
 
 class IoTChatbot:
     def __init__(self):
-        self.available_models = [
-            'meta-llama/Llama-4-Maverick-17B-128E-Instruct',
-        ]
-        self.db = Database()
+        # Model tiers per question type, with fallbacks, configured by MODEL_ROUTING
+        self.router = create_model_router()
+        self.available_models = self.router.models
+        # Pooled keep-alive connections to the provider, with timeouts, retries and a circuit breaker
+        self.upstream = create_upstream_client()
+        # Optional duplicate requests for slow answers, timed on complete answers and on first chunks
+        self.hedger = create_hedger()
+        self.stream_hedger = create_hedger()
+        self.hedge_to_fallback = os.getenv('HEDGE_TO_FALLBACK', 'false').lower() == 'true'
+        # max_tokens per question type from the lengths of recent answers
+        self.output_budget = create_output_budget()
+        # Answers to single-turn questions, shared by everyone asking the same thing
+        self.response_cache = create_response_cache()
         
-        self.system_prompt = """You are an advanced IoT and Embedded Systems expert with strong capabilities in data analysis, machine learning, and system optimization. While your primary expertise is in IoT and Embedded Systems, you also have a broad understanding of related technology fields.
-
-Your expertise includes:
-
-1. IoT and Embedded Systems Development:
-   - Microcontrollers (ESP32, Arduino, Raspberry Pi, STM32)
-   - IoT Protocols (MQTT, CoAP, HTTP, WebSocket, LoRa, Zigbee)
-   - Sensor Integration and Data Processing
-   - RTOS and Real-time Systems
-   - Low-power Design
-   - Firmware Development
-   - Wireless Communication
-   - IoT Security
-
-2. Data Analysis and Processing:
-   - Time-series data analysis
-   - Sensor data processing and filtering
-   - Statistical analysis of IoT data
-   - Pattern recognition in sensor readings
-   - Anomaly detection
-   - Data visualization
-   - Predictive maintenance analysis
-   - Energy consumption optimization
-
-3. Machine Learning and AI:
-   - Edge AI implementation
-   - TinyML for microcontrollers
-   - Sensor data classification
-   - Predictive analytics
-   - Anomaly detection models
-   - Optimization algorithms
-   - Neural networks for embedded systems
-
-4. Related Technology Fields:
-   - General Electronics and Circuit Design
-   - Programming and Software Development
-   - Networking and Communication Systems
-   - Cloud Computing and Edge Computing
-   - Data Science and Analytics
-   - Artificial Intelligence and Machine Learning
-   - Cybersecurity and Information Security
-   - Industrial Automation and Control Systems
-   - Smart Home and Building Automation
-   - Robotics and Automation
-   - Renewable Energy Systems
-   - Environmental Monitoring
-   - Healthcare Technology
-   - Transportation Systems
-   - Agricultural Technology
-
-5. Response Guidelines:
-   - Answer questions about IoT and Embedded Systems with full expertise
-   - For related technology questions, provide answers while connecting them to IoT where relevant
-   - For general technology questions, explain how IoT concepts might apply
-   - Provide clear, concise explanations without code unless specifically requested
-   - Include code only when specifically requested or when it's essential to the explanation
-   - Always explain concepts in simple terms first
-   - Use analogies when helpful for understanding
-   - Break down complex topics into digestible parts
-   - Provide real-world examples when relevant
-   - Include best practices and security considerations
-   - Consider power consumption and resource constraints
-   - Suggest appropriate hardware and software solutions
-   - Provide troubleshooting steps for common issues
-
-6. Response Format:
-   - Start with a brief overview of the answer
-   - Use bullet points or numbered lists for clarity
-   - Include diagrams or visual explanations when helpful
-   - Add code examples only when necessary
-   - End with a summary or next steps
-   - Include relevant resources or references
-   - For non-IoT topics, explain IoT connections where relevant
-
-7. Important:
-   - Maintain primary focus on IoT and Embedded Systems
-   - Be friendly and approachable
-   - Use clear, professional language
-   - Provide practical, actionable advice
-   - Consider different skill levels in explanations
-   - Encourage follow-up questions
-   - Maintain context awareness
-   - Suggest related topics when relevant
-   - Connect general technology concepts to IoT where possible"""
+        # Compact system prompts per question type, assembled once here
+        self.prompts = PromptRegistry(os.getenv('PROMPT_TEMPLATES', 'compact'))
+        self.system_prompt = self.prompts.default
+        logging.info("System prompt tokens per question type: " +
+                     ', '.join(f"{question_type}={tokens}" for question_type, tokens in self.prompts.tokens.items()))
 
     def is_greeting(self, message):
-        greetings = [
-            'hi', 'hello', 'hey', 'hai', 'halo', 'hay', 'hola', 'greetings',
-            'good morning', 'good afternoon', 'good evening', 'selamat pagi',
-            'selamat siang', 'selamat sore', 'selamat malam'
-        ]
-        message = message.lower().strip()
-        return any(greeting in message for greeting in greetings)
+        return is_greeting(message)
 
     def get_greeting_response(self):
         responses = [
@@ -131,366 +57,298 @@ Your expertise includes:
 
     def analyze_question_type(self, message):
         """Analyze the type of question to determine the appropriate response format"""
-        message = message.lower()
-        
-        # Expanded categories of keywords
-        keyword_categories = {
-            'iot_core': {
-                'hardware': [
-                    'microcontroller', 'esp32', 'arduino', 'raspberry pi', 'stm32',
-                    'sensor', 'actuator', 'board', 'circuit', 'component', 'hardware',
-                    'device', 'module', 'shield', 'breakout', 'pin', 'gpio', 'i2c',
-                    'spi', 'uart', 'adc', 'dac', 'pwm', 'relay', 'motor', 'led',
-                    'display', 'screen', 'camera', 'rfid', 'nfc', 'bluetooth',
-                    'wifi', 'ethernet', 'usb', 'serial', 'power', 'battery'
-                ],
-                'software': [
-                    'firmware', 'code', 'program', 'software', 'library', 'api',
-                    'sdk', 'ide', 'compiler', 'debug', 'upload', 'flash', 'bootloader',
-                    'os', 'operating system', 'rtos', 'thread', 'task', 'process',
-                    'memory', 'storage', 'file', 'database', 'log', 'error'
-                ],
-                'protocols': [
-                    'mqtt', 'coap', 'http', 'websocket', 'lora', 'zigbee', 'bluetooth',
-                    'wifi', 'tcp', 'udp', 'ip', 'network', 'protocol', 'communication',
-                    'wireless', 'rf', 'radio', 'signal', 'packet', 'frame', 'header',
-                    'payload', 'encryption', 'security', 'authentication'
-                ],
-                'concepts': [
-                    'iot', 'internet of things', 'embedded', 'system', 'architecture',
-                    'design', 'development', 'implementation', 'deployment', 'testing',
-                    'monitoring', 'control', 'automation', 'smart', 'intelligent',
-                    'real-time', 'low-power', 'energy', 'efficiency', 'optimization',
-                    'performance', 'reliability', 'scalability', 'security', 'privacy',
-                    'data', 'analytics', 'processing', 'storage', 'cloud', 'edge',
-                    'fog', 'gateway', 'server', 'client', 'node', 'network', 'mesh',
-                    'cluster', 'distributed', 'centralized', 'decentralized'
-                ]
-            },
-            'related_tech': {
-                'electronics': [
-                    'electronics', 'circuit', 'schematic', 'pcb', 'component',
-                    'resistor', 'capacitor', 'transistor', 'diode', 'ic',
-                    'power supply', 'voltage', 'current', 'resistance',
-                    'analog', 'digital', 'signal', 'frequency', 'oscillator'
-                ],
-                'programming': [
-                    'programming', 'coding', 'algorithm', 'data structure',
-                    'python', 'c++', 'java', 'javascript', 'rust', 'go',
-                    'function', 'class', 'object', 'variable', 'loop',
-                    'condition', 'array', 'list', 'string', 'integer'
-                ],
-                'networking': [
-                    'network', 'internet', 'web', 'server', 'client',
-                    'protocol', 'tcp/ip', 'dns', 'dhcp', 'firewall',
-                    'router', 'switch', 'gateway', 'proxy', 'vpn'
-                ],
-                'cloud': [
-                    'cloud', 'aws', 'azure', 'gcp', 'serverless',
-                    'container', 'docker', 'kubernetes', 'microservice',
-                    'api', 'rest', 'graphql', 'database', 'storage'
-                ],
-                'ai_ml': [
-                    'artificial intelligence', 'machine learning', 'deep learning',
-                    'neural network', 'tensorflow', 'pytorch', 'scikit-learn',
-                    'regression', 'classification', 'clustering', 'nlp',
-                    'computer vision', 'reinforcement learning'
-                ],
-                'security': [
-                    'security', 'cybersecurity', 'encryption', 'authentication',
-                    'authorization', 'ssl', 'tls', 'vulnerability', 'attack',
-                    'defense', 'penetration testing', 'firewall', 'antivirus'
-                ]
-            },
-            'applications': {
-                'industrial': [
-                    'industrial', 'automation', 'control', 'plc', 'scada',
-                    'manufacturing', 'production', 'quality', 'maintenance',
-                    'predictive maintenance', 'condition monitoring'
-                ],
-                'smart_home': [
-                    'smart home', 'home automation', 'smart device', 'voice control',
-                    'smart lighting', 'smart security', 'smart thermostat',
-                    'smart appliance', 'home assistant', 'voice assistant'
-                ],
-                'healthcare': [
-                    'healthcare', 'medical', 'wearable', 'fitness', 'tracker',
-                    'monitoring', 'diagnosis', 'treatment', 'telemedicine',
-                    'medical device', 'health data', 'patient care'
-                ],
-                'transportation': [
-                    'transportation', 'vehicle', 'automotive', 'autonomous',
-                    'connected car', 'fleet management', 'traffic', 'navigation',
-                    'logistics', 'supply chain', 'tracking', 'monitoring'
-                ],
-                'agriculture': [
-                    'agriculture', 'farming', 'precision', 'irrigation',
-                    'monitoring', 'automation', 'greenhouse', 'livestock',
-                    'crop', 'soil', 'weather', 'climate', 'sustainability'
-                ],
-                'environment': [
-                    'environment', 'monitoring', 'climate', 'weather',
-                    'pollution', 'air quality', 'water quality', 'noise',
-                    'conservation', 'sustainability', 'renewable energy'
-                ]
-            }
-        }
-        
-        # Check for code-related keywords
-        code_keywords = [
-            'code', 'program', 'example', 'implement', 'write', 'show me',
-            'how to', 'tutorial', 'demo', 'sample', 'sketch', 'script',
-            'function', 'method', 'class', 'object', 'variable', 'constant',
-            'loop', 'condition', 'statement', 'syntax', 'error', 'bug',
-            'debug', 'test', 'compile', 'upload', 'flash', 'run'
-        ]
-        
-        # Check for general explanation keywords
-        explanation_keywords = [
-            'what is', 'explain', 'describe', 'tell me about', 'meaning',
-            'definition', 'overview', 'introduction', 'basics', 'how does',
-            'why', 'when', 'where', 'which', 'compare', 'difference',
-            'similarity', 'advantage', 'disadvantage', 'benefit', 'drawback'
-        ]
-        
-        # Check for comparison keywords
-        comparison_keywords = [
-            'difference between', 'compare', 'vs', 'versus', 'which is better',
-            'pros and cons', 'advantages and disadvantages', 'similarities',
-            'differences', 'better than', 'worse than', 'prefer', 'choice',
-            'selection', 'recommendation', 'suggestion', 'alternative'
+        with timed(CLASSIFY_SECONDS):
+            return classify_question(message)
+
+    def build_messages(self, message, question_type, history=None, continue_from=None):
+        """Build the chat completion messages for a question, after any earlier turns of the chat.
+
+        With continue_from, the answer so far follows the question and the model is asked to carry on.
+        """
+        messages = [
+            {"role": "system", "content": self.prompts.get(question_type)},
+            *(history or []),
+            {"role": "user", "content": f"Question Type: {question_type}\n{message}"}
         ]
-        
-        # Check for troubleshooting keywords
-        troubleshooting_keywords = [
-            'error', 'problem', 'issue', 'fix', 'solve', 'troubleshoot',
-            'debug', 'not working', 'failed', 'crash', 'hang', 'freeze',
-            'slow', 'performance', 'memory', 'resource', 'connection',
-            'communication', 'network', 'hardware', 'software', 'compatibility'
+        if continue_from:
+            messages.append({"role": "assistant", "content": continue_from})
+            messages.append({"role": "user", "content": CONTINUE_PROMPT})
+        return messages
+
+    def max_tokens(self, model, question_type):
+        """The model's max_tokens, lowered to the output budget of the question type"""
+        limit = self.router.params(model)['max_tokens']
+        if self.output_budget is None:
+            return limit
+        return min(limit, self.output_budget.max_tokens(question_type))
+
+    def record_answer(self, question_type, answer, usage=None, truncated=False):
+        """Feed the length of a finished answer to the output budget"""
+        tokens = (usage or {}).get('completion_tokens') or estimate_tokens(answer)
+        ANSWER_TOKENS.labels(question_type=question_type).observe(tokens)
+        if truncated:
+            TRUNCATED_ANSWERS.labels(question_type=question_type).inc()
+        if self.output_budget is not None:
+            self.output_budget.record(question_type, tokens, truncated)
+
+    def cached_response(self, message, model, question_type, history=None):
+        """Return a cached answer, never for multi-turn prompts whose answer depends on the chat"""
+        if self.response_cache is None or history:
+            return None
+        cached = self.response_cache.get(message, model, question_type)
+        CACHE_LOOKUPS.labels(result='miss' if cached is None else 'hit').inc()
+        return cached
+
+    def cache_response(self, message, model, question_type, response, history=None):
+        if self.response_cache is None or history or not response:
+            return
+        self.response_cache.set(message, model, question_type, response)
+
+    def scope_note(self, bot_response):
+        """Return the note appended to answers that contain no IoT-related keywords"""
+        iot_keywords = [
+            'iot', 'internet of things', 'embedded', 'esp32', 'arduino', 'raspberry pi',
+            'sensor', 'actuator', 'mqtt', 'wifi', 'bluetooth', 'microcontroller',
+            'circuit', 'electronics', 'hardware', 'firmware', 'protocol', 'wireless',
+            'network', 'data', 'analytics', 'automation', 'control', 'monitoring',
+            'device', 'system', 'programming', 'code', 'development', 'project'
         ]
 
-        # Check if the question is related to any of our expertise areas
-        is_related = False
-        related_category = None
-        
-        # Check IoT core categories
-        for category, keywords in keyword_categories['iot_core'].items():
-            if any(keyword in message for keyword in keywords):
-                is_related = True
-                related_category = 'iot_core'
-                break
-        
-        # Check related technology categories
-        if not is_related:
-            for category, keywords in keyword_categories['related_tech'].items():
-                if any(keyword in message for keyword in keywords):
-                    is_related = True
-                    related_category = 'related_tech'
-                    break
-        
-        # Check application categories
-        if not is_related:
-            for category, keywords in keyword_categories['applications'].items():
-                if any(keyword in message for keyword in keywords):
-                    is_related = True
-                    related_category = 'applications'
-                    break
+        if any(keyword in bot_response.lower() for keyword in iot_keywords):
+            return ''
 
-        # If not directly related, check for technical context
-        if not is_related:
-            technical_context = any(word in message for word in [
-                'technical', 'engineering', 'project', 'build', 'create',
-                'develop', 'design', 'implement', 'solution', 'system',
-                'device', 'application', 'product', 'prototype', 'technology',
-                'innovation', 'research', 'development', 'science', 'engineering'
-            ])
-            
-            if technical_context:
-                return 'general'
-            else:
-                return 'non-technical'
-        
-        if any(keyword in message for keyword in code_keywords):
-            return 'code'
-        elif any(keyword in message for keyword in explanation_keywords):
-            return 'explanation'
-        elif any(keyword in message for keyword in comparison_keywords):
-            return 'comparison'
-        elif any(keyword in message for keyword in troubleshooting_keywords):
-            return 'troubleshooting'
-        else:
-            return 'general'
-
-    def get_response(self, message, model='meta-llama/Llama-4-Maverick-17B-128E-Instruct'):
-        """Get response from the chatbot using the specified model"""
+        return "\n\nNote: While I can answer general questions, my primary expertise is in IoT and Embedded Systems. For the most accurate and detailed information, I recommend asking questions related to:\n" + \
+               "- IoT device development and programming\n" + \
+               "- Embedded systems design and implementation\n" + \
+               "- Sensor and actuator integration\n" + \
+               "- Wireless communication protocols\n" + \
+               "- Microcontroller programming\n" + \
+               "- Circuit design and electronics\n" + \
+               "- Data collection and analysis\n" + \
+               "- System automation and control"
+
+    def model_chain(self, message, question_type, model=None):
+        """Models to try for a question in fallback order, or just the one the caller asked for"""
+        return [model] if model else self.router.route(question_type, message)
+
+    def hedge_model(self, chain, index):
+        """Model for the hedged duplicate of chain[index]: the next available fallback if configured, else the same"""
+        if self.hedge_to_fallback:
+            for model in chain[index + 1:]:
+                if self.upstream.available(model):
+                    return model
+        return chain[index]
+
+    def complete(self, model, messages, question_type, hedge_model=None):
+        """Ask one model for a complete answer, hedged when enabled"""
+        def attempt(target):
+            return lambda handle: self.upstream.chat_completion(
+                handle=handle,
+                model=target,
+                messages=messages,
+                **{**self.router.params(target), 'max_tokens': self.max_tokens(target, question_type)}
+            )
+        if self.hedger is None:
+            return attempt(model)(None)
+        return self.hedger.run(attempt(model), attempt(hedge_model or model))
+
+    def open_stream(self, model, messages, question_type, hedge_model=None, stop_event=None):
+        """Start streaming from one model, hedged when enabled.
+
+        Returns the stream and an iterator over all of its chunks; the first
+        chunk with content has already arrived, which is what a hedge races
+        for. The role-only chunk providers send right after the headers says
+        nothing about how soon tokens come, so it is held back with any other
+        empty chunks and replayed. Setting a
+        hedging.StopEvent given as stop_event closes the stream even while
+        this waits for that first chunk.
+        """
+        def attempt(target):
+            def run(handle):
+                stream = self.upstream.stream_chat_completion(
+                    handle=handle,
+                    model=target,
+                    messages=messages,
+                    **{**self.router.params(target), 'max_tokens': self.max_tokens(target, question_type)}
+                )
+                chunks = iter(stream)
+                head = []
+                for chunk in chunks:
+                    head.append(chunk)
+                    if chunk.get('choices') and chunk['choices'][0].get('delta', {}).get('content'):
+                        break
+                return stream, itertools.chain(head, chunks)
+            return run
+        if self.stream_hedger is None:
+            return attempt(model)(cancel_on_stop(stop_event, HedgeHandle()))
+        return self.stream_hedger.run(attempt(model), attempt(hedge_model or model), stop_event=stop_event)
+
+    def get_response(self, message, model=None, history=None):
+        """Get response from the chatbot using the specified model, or the one routed to for the question"""
         try:
             # Check if the requested model is available
-            if model not in self.available_models:
+            if model is not None and model not in self.available_models:
                 return f"Error: Model '{model}' is not available. Please select from: {', '.join(self.available_models)}"
             
             # Check if it's a greeting
             if self.is_greeting(message):
-                response = self.get_greeting_response()
-                # Save greeting conversation
-                self.db.save_conversation(message, response, model, 'greeting')
-                return response
+                return self.get_greeting_response()
             
             # Analyze question type
             question_type = self.analyze_question_type(message)
+            chain = self.model_chain(message, question_type, model)
             
-            # Prepare the prompt with context
-            prompt = f"{self.system_prompt}\n\nQuestion Type: {question_type}\nUser: {message}\nAssistant:"
+            # Cached under the first model of the route, whichever model answered
+            cached = self.cached_response(message, chain[0], question_type, history)
+            if cached is not None:
+                return cached
             
-            # Get response from the model
-            response = openai.ChatCompletion.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": f"Question Type: {question_type}\n{message}"}
-                ],
-                temperature=0.7,
-                max_tokens=4096,
-                top_p=0.9,
-                frequency_penalty=0.5,
-                presence_penalty=0.5
-            )
-            
-            bot_response = response.choices[0].message.content.strip()
-            
-            # If the response doesn't contain IoT-related keywords, add a note
-            iot_keywords = [
-                'iot', 'internet of things', 'embedded', 'esp32', 'arduino', 'raspberry pi',
-                'sensor', 'actuator', 'mqtt', 'wifi', 'bluetooth', 'microcontroller',
-                'circuit', 'electronics', 'hardware', 'firmware', 'protocol', 'wireless',
-                'network', 'data', 'analytics', 'automation', 'control', 'monitoring',
-                'device', 'system', 'programming', 'code', 'development', 'project'
-            ]
+            # Get response from the first model of the chain that answers
+            messages = self.build_messages(message, question_type, history)
+            for index, candidate in enumerate(chain):
+                last = index == len(chain) - 1
+                if not last and not self.upstream.available(candidate):
+                    continue
+                try:
+                    with timed(UPSTREAM_SECONDS.labels(mode='complete')):
+                        response = self.complete(candidate, messages, question_type, self.hedge_model(chain, index))
+                    break
+                except UpstreamError as e:
+                    if last:
+                        raise
+                    MODEL_FALLBACKS.labels(model=candidate).inc()
+                    logging.warning(f"Model {candidate} failed, falling back: {str(e)}")
             
-            if not any(keyword in bot_response.lower() for keyword in iot_keywords):
-                bot_response += "\n\nNote: While I can answer general questions, my primary expertise is in IoT and Embedded Systems. For the most accurate and detailed information, I recommend asking questions related to:\n" + \
-                               "- IoT device development and programming\n" + \
-                               "- Embedded systems design and implementation\n" + \
-                               "- Sensor and actuator integration\n" + \
-                               "- Wireless communication protocols\n" + \
-                               "- Microcontroller programming\n" + \
-                               "- Circuit design and electronics\n" + \
-                               "- Data collection and analysis\n" + \
-                               "- System automation and control"
+            choice = response['choices'][0]
+            bot_response = choice['message']['content'].strip()
+            truncated = choice.get('finish_reason') == 'length'
+            self.record_answer(question_type, bot_response, response.get('usage'), truncated)
             
-            # Save the conversation to database
-            self.db.save_conversation(message, bot_response, model, question_type)
+            # A cut-off answer is neither noted nor cached, it is not the whole answer
+            if not truncated:
+                # If the response doesn't contain IoT-related keywords, add a note
+                bot_response += self.scope_note(bot_response)
+                self.cache_response(message, chain[0], question_type, bot_response, history)
             
             return bot_response
         
         except Exception as e:
+            ERRORS.labels(stage='upstream').inc()
             logging.error(f"Error getting response: {str(e)}")
-            error_response = "I apologize, but I encountered an error while processing your request. Please try again."
-            # Save error conversation
-            self.db.save_conversation(message, error_response, model, 'error')
-            return error_response
+            return "I apologize, but I encountered an error while processing your request. Please try again."
+
+    def stream_response(self, message, model=None, stop_event=None, history=None, continue_from=None, result=None):
+        """Stream the response as text chunks; joining all chunks gives the same answer as get_response.
 
-    def get_conversation_history(self, limit=10):
-        """Get recent conversation history from database"""
-        return self.db.get_conversation_history(limit)
+        If stop_event is set while streaming, the upstream stream is closed and the
+        generator ends early without the scope note. A hedging.StopEvent also
+        aborts a stream still waiting for its first chunk. A model that fails before its
+        first chunk is replaced by the next one of the route. Saving the answer is up to the caller.
 
-    def __del__(self):
+        With continue_from, the answer so far to message, only the rest of that answer is streamed.
+        A result dict, if given, gets 'truncated' set when max_tokens cut the answer off.
+        """
+        parts = []
+        # Trailing whitespace waits for more text, so the answer ends stripped like get_response's
+        held = ''
+        result = result if result is not None else {}
+        result['truncated'] = False
         try:
-            # Only close database connection if we're in an application context
-            if hasattr(self, 'db') and self.db:
-                self.db.close()
+            # Check if the requested model is available
+            if model is not None and model not in self.available_models:
+                yield f"Error: Model '{model}' is not available. Please select from: {', '.join(self.available_models)}"
+                return
+
+            # Greetings are answered locally in a single chunk
+            if not continue_from and self.is_greeting(message):
+                yield self.get_greeting_response()
+                return
+
+            question_type = self.analyze_question_type(message)
+            chain = self.model_chain(message, question_type, model)
+
+            # A cache hit is sent as one chunk without calling upstream
+            cached = None if continue_from else self.cached_response(message, chain[0], question_type, history)
+            if cached is not None:
+                yield cached
+                return
+
+            messages = self.build_messages(message, question_type, history, continue_from)
+            finish_reason = None
+            usage = None
+            for index, candidate in enumerate(chain):
+                last = index == len(chain) - 1
+                if not last and not self.upstream.available(candidate):
+                    continue
+                try:
+                    upstream_start = time.perf_counter()
+                    stream, chunks = self.open_stream(candidate, messages, question_type,
+                                                      self.hedge_model(chain, index), stop_event)
+
+                    for chunk in chunks:
+                        if stop_event is not None and stop_event.is_set():
+                            # Closing the stream drops the upstream connection so generation stops there too
+                            stream.close()
+                            UPSTREAM_SECONDS.labels(mode='stopped').observe(time.perf_counter() - upstream_start)
+                            return
+                        # Some providers send the token usage in a final chunk without choices
+                        usage = chunk.get('usage') or usage
+                        if not chunk.get('choices'):
+                            continue
+                        finish_reason = chunk['choices'][0].get('finish_reason') or finish_reason
+                        content = chunk['choices'][0].get('delta', {}).get('content')
+                        if not content:
+                            continue
+                        # Match get_response, which strips the leading whitespace of the answer
+                        if not parts:
+                            # A continuation may start mid-sentence, where the space matters
+                            content = content if continue_from else content.lstrip()
+                            if not content:
+                                continue
+                            FIRST_TOKEN_SECONDS.observe(time.perf_counter() - upstream_start)
+                        text = held + content
+                        content = text.rstrip()
+                        held = text[len(content):]
+                        if not content:
+                            continue
+                        parts.append(content)
+                        yield content
+                    if stop_event is not None and stop_event.is_set():
+                        # Closed by the stop before anything came, which ends the chunks like a finished answer
+                        UPSTREAM_SECONDS.labels(mode='stopped').observe(time.perf_counter() - upstream_start)
+                        return
+                    break
+                except UpstreamError as e:
+                    if stop_event is not None and stop_event.is_set():
+                        # Closing the stream from the stop failed the read, no other model should pick it up
+                        UPSTREAM_SECONDS.labels(mode='stopped').observe(time.perf_counter() - upstream_start)
+                        return
+                    # Once part of the answer is out, another model cannot pick it up
+                    if parts or last:
+                        raise
+                    MODEL_FALLBACKS.labels(model=candidate).inc()
+                    logging.warning(f"Model {candidate} failed, falling back: {str(e)}")
+
+            UPSTREAM_SECONDS.labels(mode='stream').observe(time.perf_counter() - upstream_start)
+            bot_response = ''.join(parts).rstrip()
+            result['truncated'] = finish_reason == 'length'
+            # A continuation is only part of an answer, its length says nothing about the budget
+            if not continue_from:
+                self.record_answer(question_type, bot_response, usage, result['truncated'])
+            if result['truncated'] or continue_from:
+                # The scope note and the cache are for whole answers
+                return
+
+            note = self.scope_note(bot_response)
+            if note:
+                yield note
+
+            if parts:
+                self.cache_response(message, chain[0], question_type, bot_response + note, history)
+
         except Exception as e:
-            logging.error(f"Error closing database connection: {e}")
-
-def init_chatbot():
-    global chatbot
-    if chatbot is None:
-        chatbot = IoTChatbot()
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/api/history', methods=['GET'])
-def get_chat_history():
-    init_chatbot()
-    try:
-        history = chatbot.get_conversation_history()
-        return jsonify([{
-            'id': chat[0],
-            'user_message': chat[1],
-            'bot_response': chat[2],
-            'timestamp': chat[3].strftime('%Y-%m-%d %H:%M:%S'),
-            'model_used': chat[4],
-            'question_type': chat[5]
-        } for chat in history])
-    except Exception as e:
-        logging.error(f"Error getting chat history: {str(e)}")
-        return jsonify({'error': 'Failed to get chat history'}), 500
-
-@app.route('/api/chat/<int:chat_id>', methods=['GET'])
-def get_chat(chat_id):
-    init_chatbot()
-    try:
-        # Get the specific chat from database
-        db = Database()
-        db.cursor.execute("""
-            SELECT user_message, bot_response, timestamp, model_used, question_type
-            FROM conversations
-            WHERE id = %s
-        """, (chat_id,))
-        chat = db.cursor.fetchone()
-        db.close()
-
-        if chat:
-            return jsonify({
-                'id': chat_id,
-                'messages': [
-                    {'role': 'user', 'content': chat[0]},
-                    {'role': 'assistant', 'content': chat[1]}
-                ],
-                'timestamp': chat[2].strftime('%Y-%m-%d %H:%M:%S'),
-                'model_used': chat[3],
-                'question_type': chat[4]
-            })
-        else:
-            return jsonify({'error': 'Chat not found'}), 404
-    except Exception as e:
-        logging.error(f"Error getting chat: {str(e)}")
-        return jsonify({'error': 'Failed to get chat'}), 500
-
-@app.route('/api/chat', methods=['POST'])
-def handle_chat():
-    init_chatbot()
-    try:
-        data = request.json
-        message = data.get('message')
-        chat_id = data.get('chat_id')
-        is_new_chat = data.get('is_new_chat', True)
-
-        if not message:
-            return jsonify({'error': 'Message is required'}), 400
-
-        # Get response from chatbot
-        response = chatbot.get_response(message)
-        
-        # If it's a new chat, create a new conversation
-        if is_new_chat:
-            db = Database()
-            db.cursor.execute("""
-                INSERT INTO conversations (user_message, bot_response, model_used, question_type)
-                VALUES (%s, %s, %s, %s)
-            """, (message, response, 'meta-llama/Llama-4-Maverick-17B-128E-Instruct', 'general'))
-            db.connection.commit()
-            chat_id = db.cursor.lastrowid
-            db.close()
-
-        return jsonify({
-            'response': response,
-            'chat_id': chat_id
-        })
-    except Exception as e:
-        logging.error(f"Error handling chat: {str(e)}")
-        return jsonify({'error': 'Failed to process chat'}), 500
-
-if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+            ERRORS.labels(stage='upstream').inc()
+            logging.error(f"Error streaming response: {str(e)}")
+            error_response = "I apologize, but I encountered an error while processing your request. Please try again."
+            # Keep whatever was already streamed and tell the user the answer is incomplete
+            yield f"\n\n{error_response}" if parts else error_response
@@ -0,0 +1,194 @@
+"""Message queue for running the Socket.IO server as several processes.
+
+With SOCKETIO_MESSAGE_QUEUE set, every server process publishes its emits to
+the queue and delivers the ones addressed to its own clients, so an answer
+produced in one process reaches a client connected to another. Redis, AMQP
+and Kafka URLs use the managers that come with python-socketio. A tcp:// URL
+uses LocalBroker, a small stand-in broker for trying this out locally:
+
+    python message_queue.py --port 6390
+    SOCKETIO_MESSAGE_QUEUE=tcp://127.0.0.1:6390 PORT=5001 python app.py
+    SOCKETIO_MESSAGE_QUEUE=tcp://127.0.0.1:6390 PORT=5002 python app.py
+"""
+import os
+import time
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from urllib.parse import urlparse
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'iot-assistant'
+
+
+class LocalBrokerManager(socketio.PubSubManager):
+    """Socket.IO client manager that talks to a LocalBroker over TCP.
+
+    Messages are JSON, one per line. Publishing reuses one connection and
+    reconnects once if it was dropped; the listener reconnects every second
+    until the broker is back.
+    """
+
+    name = 'localbroker'
+
+    def __init__(self, url='tcp://127.0.0.1:6390', channel=DEFAULT_CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 6390)
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self, role):
+        conn = socket.create_connection(self.address, timeout=5)
+        conn.sendall(f"{role} {self.channel}\n".encode('utf-8'))
+        return conn
+
+    def _publish(self, data):
+        line = self.json.dumps(data).encode('utf-8') + b'\n'
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect('PUB')
+                    self._publisher.sendall(line)
+                    return
+                except OSError:
+                    if self._publisher is not None:
+                        self._publisher.close()
+                        self._publisher = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                conn = self._connect('SUB')
+                # Subscribers wait for messages for as long as the broker is up
+                conn.settimeout(None)
+                with conn, conn.makefile('rb') as lines:
+                    for line in lines:
+                        yield line
+                error = 'closed by the broker'
+            except OSError as e:
+                error = str(e)
+            self._get_logger().warning(f"Lost the message queue connection ({error}), reconnecting")
+            time.sleep(1)
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """Stand-in pub/sub broker for local multi-process runs, not for production.
+
+    A client starts with ``PUB <channel>`` or ``SUB <channel>``. Every line a
+    publisher sends afterwards is forwarded to every subscriber of the same
+    channel. Lines are forwarded one at a time so they never interleave, and a
+    subscriber that cannot take one within ``send_timeout`` seconds is dropped.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, send_timeout=5):
+        super().__init__(address, LocalBrokerHandler)
+        self.send_timeout = send_timeout
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel, conn):
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(conn)
+
+    def unsubscribe(self, channel, conn):
+        with self.lock:
+            self.subscribers.get(channel, set()).discard(conn)
+
+    def forward(self, channel, line):
+        with self.lock:
+            subscribers = self.subscribers.get(channel, set())
+            for conn in list(subscribers):
+                try:
+                    conn.sendall(line)
+                except OSError:
+                    # A partly sent line would garble the stream, the subscriber reconnects instead
+                    subscribers.discard(conn)
+                    try:
+                        conn.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+
+class LocalBrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            role, channel = self.rfile.readline().decode('utf-8').split()
+        except ValueError:
+            return
+        if role == 'SUB':
+            self.request.settimeout(self.server.send_timeout)
+            self.server.subscribe(channel, self.request)
+            try:
+                # Nothing is read from subscribers, this only notices when they go away
+                while True:
+                    try:
+                        if not self.request.recv(1024):
+                            break
+                    except socket.timeout:
+                        continue
+            except OSError:
+                pass
+            finally:
+                self.server.unsubscribe(channel, self.request)
+        elif role == 'PUB':
+            for line in self.rfile:
+                self.server.forward(channel, line)
+
+
+def socketio_queue_options():
+    """SocketIO keyword arguments for the queue in SOCKETIO_MESSAGE_QUEUE, empty for a single process"""
+    url = os.getenv('SOCKETIO_MESSAGE_QUEUE', '').strip()
+    channel = os.getenv('SOCKETIO_CHANNEL', DEFAULT_CHANNEL)
+    if not url:
+        return {}
+    if url.startswith('tcp://'):
+        return {'client_manager': LocalBrokerManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
+
+
+def create_emitter():
+    """Write-only manager for emitting to clients from a process that is not a Socket.IO server, or None"""
+    url = os.getenv('SOCKETIO_MESSAGE_QUEUE', '').strip()
+    channel = os.getenv('SOCKETIO_CHANNEL', DEFAULT_CHANNEL)
+    if not url:
+        return None
+    if url.startswith('tcp://'):
+        return LocalBrokerManager(url, channel=channel, write_only=True)
+    # The same choice of manager as Flask-SocketIO makes for the server
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager(url, channel=channel, write_only=True)
+    if url.startswith('kafka://'):
+        return socketio.KafkaManager(url, channel=channel, write_only=True)
+    if url.startswith('zmq'):
+        return socketio.ZmqManager(url, channel=channel, write_only=True)
+    return socketio.KombuManager(url, channel=channel, write_only=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in message queue for multi-process Socket.IO")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with LocalBroker((args.host, args.port)) as broker:
+        logger.info(f"Message queue listening on tcp://{args.host}:{args.port}")
+        try:
+            broker.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
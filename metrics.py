@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, for upstream calls and for in-process work, and answer length buckets in tokens
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+TOKEN_BUCKETS = (64, 128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, 0.05, 0.25, 1)
+
+
+class _NoopMetric:
+    """Stands in for every metric when prometheus_client is not installed"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _counter(name, documentation, labelnames=()):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+
+def _histogram(name, documentation, buckets, labelnames=()):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Histogram(name, documentation, labelnames, buckets=buckets)
+
+
+def _gauge(name, documentation):
+    if prometheus_client is None:
+        return _NoopMetric()
+    # livesum adds up the values of the worker processes that are still running
+    return prometheus_client.Gauge(name, documentation, multiprocess_mode='livesum')
+
+
+UPSTREAM_SECONDS = _histogram('iot_upstream_seconds', 'Duration of upstream chat completion calls',
+                              UPSTREAM_BUCKETS, ['mode'])
+FIRST_TOKEN_SECONDS = _histogram('iot_time_to_first_token_seconds',
+                                 'Time from sending a streamed request to its first content chunk', UPSTREAM_BUCKETS)
+CLASSIFY_SECONDS = _histogram('iot_classify_seconds', 'Time spent classifying the question type', FAST_BUCKETS)
+DB_WRITE_SECONDS = _histogram('iot_db_write_seconds', 'Duration of chat message batch inserts and commits',
+                              FAST_BUCKETS)
+EMIT_SECONDS = _histogram('iot_emit_seconds', 'Time spent in socketio.emit for answers and chunks',
+                          FAST_BUCKETS, ['event'])
+QUEUE_WAIT_SECONDS = _histogram('iot_llm_queue_wait_seconds', 'Time messages wait for an LLM worker',
+                                UPSTREAM_BUCKETS)
+MESSAGE_SECONDS = _histogram('iot_message_seconds', 'Total time to answer a message, from receipt to last emit',
+                             UPSTREAM_BUCKETS)
+ANSWER_TOKENS = _histogram('iot_answer_tokens', 'Length of generated answers in tokens, by question type',
+                           TOKEN_BUCKETS, ['question_type'])
+LLM_QUEUED = _gauge('iot_llm_queued', 'Messages waiting for an LLM worker')
+LLM_ACTIVE = _gauge('iot_llm_active', 'Messages being answered by an LLM worker')
+MESSAGES = _counter('iot_messages_total', 'Messages handled, by outcome', ['outcome'])
+UPSTREAM_RETRIES = _counter('iot_upstream_retries_total', 'Upstream requests sent again after a retryable failure')
+UPSTREAM_FAST_FAILS = _counter('iot_upstream_fast_fails_total', 'Upstream calls refused by the open circuit breaker')
+MODEL_FALLBACKS = _counter('iot_model_fallbacks_total', 'Models that failed before answering, so the next one was tried',
+                           ['model'])
+HEDGES_FIRED = _counter('iot_hedges_fired_total', 'Duplicate upstream requests sent because the first was slow')
+HEDGES_WON = _counter('iot_hedges_won_total', 'Hedged requests that answered before the original')
+TRUNCATED_ANSWERS = _counter('iot_truncated_answers_total', 'Answers cut off by their max_tokens budget',
+                             ['question_type'])
+DROPPED_MESSAGES = _counter('iot_chat_messages_dropped_total',
+                            'Chat messages not saved after repeated write failures or with the write queue full',
+                            ['reason'])
+CACHE_LOOKUPS = _counter('iot_response_cache_lookups_total', 'Response cache lookups, by result', ['result'])
+ERRORS = _counter('iot_errors_total', 'Errors, by stage', ['stage'])
+
+
+@contextmanager
+def timed(histogram):
+    """Observe the duration of the block on a histogram (or a labelled child of one)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def render_latest():
+    """Return the (body, content type) of the /metrics response.
+
+    With PROMETHEUS_MULTIPROC_DIR set, every worker process writes its samples
+    there and the response sums them across processes; the directory must be
+    emptied before the server starts.
+    """
+    if prometheus_client is None:
+        return "# prometheus_client is not installed\n", 'text/plain; charset=utf-8'
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges of an exited worker, e.g. from gunicorn's child_exit hook"""
+    if prometheus_client is not None and os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
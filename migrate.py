@@ -1,14 +1,17 @@
 from flask import Flask
-from database import db, Database
+from database import db, Database, ChatHistory, ChatMessage
 import os
+import sys
+import sqlite3
 from dotenv import load_dotenv
-from sqlalchemy import text
+from sqlalchemy import text, inspect
+from sqlalchemy.engine import make_url
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or f"mysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize database
@@ -26,5 +29,45 @@ def migrate():
         except Exception as e:
             print(f"Error during migration: {str(e)}")
 
+def add_chat_history_indexes():
+    """Create the composite indexes used by the chat history queries on existing databases"""
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            for table in (ChatHistory.__table__, ChatMessage.__table__):
+                existing = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in existing:
+                        continue
+                    index.create(bind=db.engine)
+                    print(f"Created index {index.name} on {table.name}")
+            print("Index migration completed successfully!")
+        except Exception as e:
+            print(f"Error during index migration: {str(e)}")
+
+def sync_sqlite_replica():
+    """Copy the SQLite primary over the SQLite replica.
+    
+    Stands in for replication when trying the read/write split locally with
+    DATABASE_URL and DATABASE_REPLICA_URL pointing at two SQLite files; run it
+    repeatedly (or in a loop) to simulate replica lag.
+    """
+    primary = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    replica = make_url(os.getenv('DATABASE_REPLICA_URL') or 'mysql://')
+    if primary.get_backend_name() != 'sqlite' or replica.get_backend_name() != 'sqlite':
+        print("sync-replica needs SQLite DATABASE_URL and DATABASE_REPLICA_URL")
+        return
+    source = sqlite3.connect(primary.database)
+    target = sqlite3.connect(replica.database)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+    print(f"Copied {primary.database} to {replica.database}")
+
 if __name__ == '__main__':
-    migrate() 
\ No newline at end of file
+    if sys.argv[1:] == ['sync-replica']:
+        sync_sqlite_replica()
+    else:
+        migrate()
+        add_chat_history_indexes()
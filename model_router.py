@@ -0,0 +1,80 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'meta-llama/Llama-4-Maverick-17B-128E-Instruct'
+
+# Generation parameters used for every model unless its entry in "models" overrides them
+DEFAULT_PARAMS = {
+    'temperature': 0.7,
+    'max_tokens': 4096,
+    'top_p': 0.9,
+    'frequency_penalty': 0.5,
+    'presence_penalty': 0.5
+}
+
+# Everything on the one model until MODEL_ROUTING configures smaller tiers
+DEFAULT_ROUTING = {
+    'tiers': {'default': [DEFAULT_MODEL]},
+    'routes': {},
+    'default_tier': 'default'
+}
+
+
+class ModelRouter:
+    """Choose the models to ask for a question from its type and length.
+
+    ``routes`` maps question types to tiers and ``tiers`` maps each tier to
+    its models in fallback order: the first is tried first, the next ones
+    only when the previous one fails before answering. Messages of at least
+    ``long_message_chars`` characters go to ``long_message_tier`` whatever
+    their type. ``models`` holds per-model overrides of DEFAULT_PARAMS.
+    """
+
+    def __init__(self, tiers, routes=None, default_tier=None, long_message_chars=None,
+                 long_message_tier=None, models=None):
+        if not tiers:
+            raise ValueError("At least one model tier is required")
+        self.tiers = {tier: list(chain) for tier, chain in tiers.items()}
+        self.routes = dict(routes or {})
+        self.default_tier = default_tier or next(iter(self.tiers))
+        self.long_message_chars = long_message_chars
+        self.long_message_tier = long_message_tier
+        self.model_params = {model: {**DEFAULT_PARAMS, **params} for model, params in (models or {}).items()}
+
+        for tier in [self.default_tier, self.long_message_tier, *self.routes.values()]:
+            if tier is not None and tier not in self.tiers:
+                raise ValueError(f"Unknown model tier '{tier}'")
+        for tier, chain in self.tiers.items():
+            if not chain:
+                raise ValueError(f"Model tier '{tier}' has no models")
+
+    @property
+    def models(self):
+        """Every configured model, each once, in tier order"""
+        return list(dict.fromkeys(model for chain in self.tiers.values() for model in chain))
+
+    def tier_for(self, question_type, message=''):
+        if self.long_message_tier and self.long_message_chars and len(message) >= self.long_message_chars:
+            return self.long_message_tier
+        return self.routes.get(question_type, self.default_tier)
+
+    def route(self, question_type, message=''):
+        """Return the models to try for a question, in fallback order"""
+        return self.tiers[self.tier_for(question_type, message)]
+
+    def params(self, model):
+        return self.model_params.get(model, DEFAULT_PARAMS)
+
+
+def create_model_router():
+    """Build the router from MODEL_ROUTING (inline JSON or a path to a JSON file), or the single-model default"""
+    config = os.getenv('MODEL_ROUTING', '').strip()
+    if not config:
+        return ModelRouter(**DEFAULT_ROUTING)
+    if not config.startswith('{'):
+        with open(config) as f:
+            config = f.read()
+    return ModelRouter(**json.loads(config))
@@ -1,12 +1,17 @@
 import sys
 import os
+import signal
 
 # Add your project directory to the Python path
 sys.path.insert(0, os.path.dirname(__file__))
 
-# Import your Flask application
+# Import your Flask application. Passenger serves Socket.IO over long-polling through it; when
+# Passenger runs more than one process, set PassengerStickySessions on and SOCKETIO_MESSAGE_QUEUE
 from app import app as application
 
+# Passenger stops or recycles a worker with SIGTERM; exit normally so queued chat messages are flushed by atexit
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
 # Set environment variables
 os.environ['FLASK_ENV'] = 'production'
 os.environ['FLASK_APP'] = 'app.py' 
\ No newline at end of file
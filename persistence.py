@@ -0,0 +1,176 @@
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from database import db, ChatMessage, recent_writes
+from metrics import timed, DB_WRITE_SECONDS, DROPPED_MESSAGES, ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Batch chat message inserts off the response path.
+
+    Messages are queued in memory with their creation time and written by a
+    background flusher every ``flush_interval`` seconds, or as soon as
+    ``batch_size`` are waiting, as one multi-row INSERT per transaction. When
+    a batch fails, its rows are written one at a time so a single bad row
+    (say, for a chat deleted meanwhile) cannot hold up the others. Rows that
+    still fail go back to the front of the queue and are retried with
+    exponential backoff, up to ``max_attempts`` times, after which they are
+    logged and dropped. At most ``max_pending`` rows are queued; beyond that
+    a message is written synchronously, and dropped if that fails too.
+    Everything still queued is flushed when the process exits, and readers
+    can call ``flush_pending`` to see their own writes first.
+    """
+
+    def __init__(self, app, flush_interval=0.2, batch_size=200, spawn=None, max_attempts=8, max_pending=10000,
+                 max_backoff=30):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self._spawn = spawn
+        # (user_id, row, failed attempts) in insertion order
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._running = False
+        self._retry_delay = 0
+        self._retry_at = 0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        if self._spawn is not None:
+            self._spawn(self._run)
+        else:
+            threading.Thread(target=self._run, daemon=True).start()
+        atexit.register(self.close)
+
+    def enqueue(self, chat_id, user_message, bot_response, user_id=None):
+        """Queue a message for insertion; user_id is only kept to answer has_pending"""
+        row = {
+            'chat_id': chat_id,
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'created_at': datetime.utcnow()
+        }
+        with self._cond:
+            full = len(self._pending) >= self.max_pending
+            if not full:
+                self._pending.append((user_id, row, 0))
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify()
+        if full:
+            # The database has been failing for a while; do not let the queue grow without bound
+            if not self._write([(user_id, row, 0)]):
+                DROPPED_MESSAGES.labels(reason='queue_full').inc()
+                logger.error(f"Dropping a chat message for chat {row['chat_id']}: "
+                             f"{self.max_pending} messages already queued")
+            return
+        # Without a running flusher, write straight through
+        if not self._running:
+            self.flush()
+
+    def has_pending(self, chat_id=None, user_id=None):
+        with self._cond:
+            return any((chat_id is None or row['chat_id'] == chat_id) and
+                       (user_id is None or owner == user_id)
+                       for owner, row, _ in self._pending)
+
+    def flush_pending(self, chat_id=None, user_id=None):
+        """Flush now if anything queued belongs to this chat or user, for read-your-writes"""
+        if self.has_pending(chat_id=chat_id, user_id=user_id):
+            self.flush()
+
+    def flush(self, force=False):
+        """Write everything queued so far; returns the number of messages written.
+
+        After a failure nothing is written until the backoff has passed, unless force is set.
+        """
+        written = 0
+        # One flusher at a time keeps batches in insertion order
+        with self._flush_lock:
+            if not force and time.monotonic() < self._retry_at:
+                return written
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.batch_size]
+                    del self._pending[:self.batch_size]
+                if not batch:
+                    self._retry_delay = 0
+                    return written
+                if self._write(batch):
+                    written += len(batch)
+                    continue
+                # Find the rows that fail on their own and write the rest
+                failed = []
+                for entry in batch:
+                    if self._write([entry]):
+                        written += 1
+                    else:
+                        failed.append(entry)
+                retry = self._give_up_on(failed)
+                if retry:
+                    with self._cond:
+                        self._pending[:0] = retry
+                    self._retry_delay = min(max(self._retry_delay * 2, self.flush_interval), self.max_backoff)
+                    self._retry_at = time.monotonic() + self._retry_delay
+                    return written
+
+    def _give_up_on(self, failed):
+        """Count a failed attempt for each row; returns the rows to retry and drops the ones out of attempts"""
+        retry = []
+        for user_id, row, attempts in failed:
+            if attempts + 1 < self.max_attempts:
+                retry.append((user_id, row, attempts + 1))
+                continue
+            DROPPED_MESSAGES.labels(reason='write_failed').inc()
+            logger.error(f"Dropping a chat message for chat {row['chat_id']} after {self.max_attempts} failed writes")
+        return retry
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                with timed(DB_WRITE_SECONDS):
+                    db.session.execute(ChatMessage.__table__.insert(), [row for _, row, _ in batch])
+                    db.session.commit()
+                for user_id, row, _ in batch:
+                    recent_writes.record(chat_id=row['chat_id'], user_id=user_id)
+                return True
+            except Exception as e:
+                db.session.rollback()
+                ERRORS.labels(stage='db_write').inc()
+                logger.error(f"Error writing {len(batch)} chat messages: {str(e)}")
+                return False
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                self._cond.wait(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        """Stop the flusher and write out everything still queued"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        # Retry a few times so a brief database outage at shutdown does not lose messages
+        for attempt in range(3):
+            self.flush(force=True)
+            if not self.has_pending():
+                return
+            time.sleep(0.5 * (attempt + 1))
+        DROPPED_MESSAGES.labels(reason='shutdown').inc(len(self._pending))
+        logger.error(f"Dropping unsaved chat messages at shutdown: {len(self._pending)} still queued")
@@ -0,0 +1,271 @@
+import re
+
+# Keyword tables used to classify incoming messages. They are compiled once at
+# import into the matchers at the bottom of this module, so adding keywords
+# does not make classification slower.
+
+KEYWORD_CATEGORIES = {
+    'iot_core': {
+        'hardware': [
+            'microcontroller', 'esp32', 'arduino', 'raspberry pi', 'stm32',
+            'sensor', 'actuator', 'board', 'circuit', 'component', 'hardware',
+            'device', 'module', 'shield', 'breakout', 'pin', 'gpio', 'i2c',
+            'spi', 'uart', 'adc', 'dac', 'pwm', 'relay', 'motor', 'led',
+            'display', 'screen', 'camera', 'rfid', 'nfc', 'bluetooth',
+            'wifi', 'ethernet', 'usb', 'serial', 'power', 'battery'
+        ],
+        'software': [
+            'firmware', 'code', 'program', 'software', 'library', 'api',
+            'sdk', 'ide', 'compiler', 'debug', 'upload', 'flash', 'bootloader',
+            'os', 'operating system', 'rtos', 'thread', 'task', 'process',
+            'memory', 'storage', 'file', 'database', 'log', 'error'
+        ],
+        'protocols': [
+            'mqtt', 'coap', 'http', 'websocket', 'lora', 'zigbee', 'bluetooth',
+            'wifi', 'tcp', 'udp', 'ip', 'network', 'protocol', 'communication',
+            'wireless', 'rf', 'radio', 'signal', 'packet', 'frame', 'header',
+            'payload', 'encryption', 'security', 'authentication'
+        ],
+        'concepts': [
+            'iot', 'internet of things', 'embedded', 'system', 'architecture',
+            'design', 'development', 'implementation', 'deployment', 'testing',
+            'monitoring', 'control', 'automation', 'smart', 'intelligent',
+            'real-time', 'low-power', 'energy', 'efficiency', 'optimization',
+            'performance', 'reliability', 'scalability', 'security', 'privacy',
+            'data', 'analytics', 'processing', 'storage', 'cloud', 'edge',
+            'fog', 'gateway', 'server', 'client', 'node', 'network', 'mesh',
+            'cluster', 'distributed', 'centralized', 'decentralized'
+        ]
+    },
+    'related_tech': {
+        'electronics': [
+            'electronics', 'circuit', 'schematic', 'pcb', 'component',
+            'resistor', 'capacitor', 'transistor', 'diode', 'ic',
+            'power supply', 'voltage', 'current', 'resistance',
+            'analog', 'digital', 'signal', 'frequency', 'oscillator'
+        ],
+        'programming': [
+            'programming', 'coding', 'algorithm', 'data structure',
+            'python', 'c++', 'java', 'javascript', 'rust', 'go',
+            'function', 'class', 'object', 'variable', 'loop',
+            'condition', 'array', 'list', 'string', 'integer'
+        ],
+        'networking': [
+            'network', 'internet', 'web', 'server', 'client',
+            'protocol', 'tcp/ip', 'dns', 'dhcp', 'firewall',
+            'router', 'switch', 'gateway', 'proxy', 'vpn'
+        ],
+        'cloud': [
+            'cloud', 'aws', 'azure', 'gcp', 'serverless',
+            'container', 'docker', 'kubernetes', 'microservice',
+            'api', 'rest', 'graphql', 'database', 'storage'
+        ],
+        'ai_ml': [
+            'artificial intelligence', 'machine learning', 'deep learning',
+            'neural network', 'tensorflow', 'pytorch', 'scikit-learn',
+            'regression', 'classification', 'clustering', 'nlp',
+            'computer vision', 'reinforcement learning'
+        ],
+        'security': [
+            'security', 'cybersecurity', 'encryption', 'authentication',
+            'authorization', 'ssl', 'tls', 'vulnerability', 'attack',
+            'defense', 'penetration testing', 'firewall', 'antivirus'
+        ]
+    },
+    'applications': {
+        'industrial': [
+            'industrial', 'automation', 'control', 'plc', 'scada',
+            'manufacturing', 'production', 'quality', 'maintenance',
+            'predictive maintenance', 'condition monitoring'
+        ],
+        'smart_home': [
+            'smart home', 'home automation', 'smart device', 'voice control',
+            'smart lighting', 'smart security', 'smart thermostat',
+            'smart appliance', 'home assistant', 'voice assistant'
+        ],
+        'healthcare': [
+            'healthcare', 'medical', 'wearable', 'fitness', 'tracker',
+            'monitoring', 'diagnosis', 'treatment', 'telemedicine',
+            'medical device', 'health data', 'patient care'
+        ],
+        'transportation': [
+            'transportation', 'vehicle', 'automotive', 'autonomous',
+            'connected car', 'fleet management', 'traffic', 'navigation',
+            'logistics', 'supply chain', 'tracking', 'monitoring'
+        ],
+        'agriculture': [
+            'agriculture', 'farming', 'precision', 'irrigation',
+            'monitoring', 'automation', 'greenhouse', 'livestock',
+            'crop', 'soil', 'weather', 'climate', 'sustainability'
+        ],
+        'environment': [
+            'environment', 'monitoring', 'climate', 'weather',
+            'pollution', 'air quality', 'water quality', 'noise',
+            'conservation', 'sustainability', 'renewable energy'
+        ]
+    }
+}
+
+# Code-related keywords
+CODE_KEYWORDS = [
+    'code', 'program', 'example', 'implement', 'write', 'show me',
+    'how to', 'tutorial', 'demo', 'sample', 'sketch', 'script',
+    'function', 'method', 'class', 'object', 'variable', 'constant',
+    'loop', 'condition', 'statement', 'syntax', 'error', 'bug',
+    'debug', 'test', 'compile', 'upload', 'flash', 'run'
+]
+
+# General explanation keywords
+EXPLANATION_KEYWORDS = [
+    'what is', 'explain', 'describe', 'tell me about', 'meaning',
+    'definition', 'overview', 'introduction', 'basics', 'how does',
+    'why', 'when', 'where', 'which', 'compare', 'difference',
+    'similarity', 'advantage', 'disadvantage', 'benefit', 'drawback'
+]
+
+# Comparison keywords
+COMPARISON_KEYWORDS = [
+    'difference between', 'compare', 'vs', 'versus', 'which is better',
+    'pros and cons', 'advantages and disadvantages', 'similarities',
+    'differences', 'better than', 'worse than', 'prefer', 'choice',
+    'selection', 'recommendation', 'suggestion', 'alternative'
+]
+
+# Troubleshooting keywords
+TROUBLESHOOTING_KEYWORDS = [
+    'error', 'problem', 'issue', 'fix', 'solve', 'troubleshoot',
+    'debug', 'not working', 'failed', 'crash', 'hang', 'freeze',
+    'slow', 'performance', 'memory', 'resource', 'connection',
+    'communication', 'network', 'hardware', 'software', 'compatibility'
+]
+
+# Words that mark a message as technical even when no expertise area matches
+TECHNICAL_CONTEXT_KEYWORDS = [
+    'technical', 'engineering', 'project', 'build', 'create',
+    'develop', 'design', 'implement', 'solution', 'system',
+    'device', 'application', 'product', 'prototype', 'technology',
+    'innovation', 'research', 'development', 'science'
+]
+
+GREETINGS = [
+    'hi', 'hello', 'hey', 'hai', 'halo', 'hay', 'hola', 'greetings',
+    'good morning', 'good afternoon', 'good evening', 'selamat pagi',
+    'selamat siang', 'selamat sore', 'selamat malam'
+]
+
+
+class KeywordMatcher:
+    """Find every keyword category present in a message with one regex scan.
+
+    All keywords are folded into a single trie-shaped pattern, so the cost of a
+    scan depends on the message length rather than on the number of keywords.
+    Keywords only match whole words ('hi' does not match 'this'); with
+    ``inflections`` enabled they also match common endings ('sensors',
+    'errors', 'uploading').
+    """
+
+    WORD_CHARS = 'a-z0-9'
+    INFLECTIONS = '(?:s|es|ed|ing|er|ers)?'
+
+    def __init__(self, categories, inflections=False):
+        labels = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                labels.setdefault(keyword.lower(), set()).add(category)
+
+        # A long keyword also counts for the shorter keywords inside it, so
+        # 'difference between' still reports the category of 'difference'
+        for keyword in labels:
+            for other in labels:
+                if other != keyword and other in keyword and \
+                        re.search(self._bounded(re.escape(other)), keyword):
+                    labels[keyword] |= labels[other]
+
+        self.labels = {keyword: frozenset(found) for keyword, found in labels.items()}
+        suffix = self.INFLECTIONS if inflections else ''
+        # Zero-width lookahead so overlapping keywords at every word start are seen
+        self.pattern = re.compile(
+            f'(?<![{self.WORD_CHARS}])(?=({self._trie_pattern(self.labels)}){suffix}(?![{self.WORD_CHARS}]))'
+        )
+
+    def _bounded(self, pattern):
+        return f'(?<![{self.WORD_CHARS}]){pattern}(?![{self.WORD_CHARS}])'
+
+    @staticmethod
+    def _trie_pattern(keywords):
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = True
+
+        def build(node):
+            terminal = '' in node
+            branches = [re.escape(char) + build(child)
+                        for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ''
+            body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+            # Greedy optional group tries the longest keyword first
+            if terminal:
+                return f'(?:{body})?'
+            return body
+
+        return build(trie)
+
+    def match(self, message):
+        """Return the set of categories whose keywords appear in the message"""
+        found = set()
+        for keyword in self.pattern.findall(message.lower()):
+            found |= self.labels[keyword]
+        return found
+
+    def search(self, message):
+        """Return True if any keyword appears in the message"""
+        return self.pattern.search(message.lower()) is not None
+
+
+DOMAIN_CATEGORIES = frozenset(
+    category for group in KEYWORD_CATEGORIES.values() for category in group
+)
+
+# Question types in priority order, the first one matched wins
+QUESTION_TYPES = ['code', 'explanation', 'comparison', 'troubleshooting']
+
+_QUESTION_MATCHER = KeywordMatcher({
+    **{category: keywords
+       for group in KEYWORD_CATEGORIES.values()
+       for category, keywords in group.items()},
+    'code': CODE_KEYWORDS,
+    'explanation': EXPLANATION_KEYWORDS,
+    'comparison': COMPARISON_KEYWORDS,
+    'troubleshooting': TROUBLESHOOTING_KEYWORDS,
+    'technical': TECHNICAL_CONTEXT_KEYWORDS,
+}, inflections=True)
+
+_GREETING_MATCHER = KeywordMatcher({'greeting': GREETINGS})
+
+
+def matched_categories(message):
+    """Return every keyword category found in the message"""
+    return _QUESTION_MATCHER.match(message)
+
+
+def classify_question(message):
+    """Classify a message as code, explanation, comparison, troubleshooting, general or non-technical"""
+    categories = _QUESTION_MATCHER.match(message)
+
+    # Questions outside our expertise areas only need to be told apart by technical context
+    if not categories & DOMAIN_CATEGORIES:
+        return 'general' if 'technical' in categories else 'non-technical'
+
+    for question_type in QUESTION_TYPES:
+        if question_type in categories:
+            return question_type
+    return 'general'
+
+
+def is_greeting(message):
+    """Return True if the message contains a greeting word or phrase"""
+    return _GREETING_MATCHER.search(message.strip())
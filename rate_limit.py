@@ -0,0 +1,178 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+def take_token(tokens, updated, now, rate, burst):
+    """Refill a bucket and take one token; returns the tokens left and the seconds to wait, 0 if one was taken"""
+    tokens = min(burst, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryRateLimitBackend:
+    """Token buckets in this process, for a single worker process and for tests"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, retry_after = take_token(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # The least recently seen buckets go first, they have refilled long ago
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class SQLiteRateLimitBackend:
+    """Token buckets in a SQLite file, shared by every worker process on the host"""
+
+    def __init__(self, path='rate_limits.sqlite3', prune_after=3600):
+        self.path = path
+        self.prune_after = prune_after
+        self._local = threading.local()
+        self._takes = 0
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limits_updated ON rate_limits (updated)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit, transactions are begun explicitly so the read and the write are one
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front, so two processes cannot both spend the last token
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+            tokens, retry_after = take_token(tokens, updated, now, rate, burst)
+            conn.execute("INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                # Buckets idle this long are full again, the same as no row at all
+                conn.execute("DELETE FROM rate_limits WHERE updated < ?", (now - self.prune_after,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+class RedisRateLimitBackend:
+    """Token buckets in Redis, for worker processes spread over several hosts.
+
+    The refill runs as a Lua script so it is atomic on the server; idle
+    buckets expire once they would be full again.
+    """
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or burst
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+        local retry_after = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            retry_after = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(retry_after)
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='iot-assistant:ratelimit:'):
+        if redis is None:
+            raise RuntimeError("The redis package is required for the redis rate limit backend")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst):
+        return float(self._script(keys=[self.prefix + key], args=[rate, burst, time.time()]))
+
+
+class RateLimiter:
+    """Per-user and per-session token buckets in front of the LLM.
+
+    Each bucket holds up to ``burst`` messages and refills at ``per_minute``
+    messages a minute. Logged-in users are limited per account with the
+    ``user_*`` limits, anonymous sessions with the ``anon_*`` ones. The
+    backend decides how far the limits reach: one process (memory), one host
+    (sqlite) or every host (redis). If the backend fails, messages are let
+    through rather than refused.
+    """
+
+    def __init__(self, backend, user_per_minute=20, user_burst=5, anon_per_minute=6, anon_burst=3):
+        self.backend = backend
+        self.user_limit = (user_per_minute / 60, user_burst)
+        self.anon_limit = (anon_per_minute / 60, anon_burst)
+
+    def check(self, key, logged_in):
+        """Spend one message from key's bucket; returns the seconds to wait, 0 if the message may go"""
+        rate, burst = self.user_limit if logged_in else self.anon_limit
+        try:
+            return self.backend.take(key, rate, burst)
+        except Exception as e:
+            logger.error(f"Error checking rate limit: {str(e)}")
+            return 0.0
+
+
+def create_rate_limiter():
+    """Build the rate limiter configured by the RATE_LIMIT_* environment variables, or None"""
+    backend_name = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+    if backend_name in ('', 'none', 'off'):
+        return None
+    if backend_name == 'memory':
+        backend = MemoryRateLimitBackend()
+    elif backend_name == 'sqlite':
+        backend = SQLiteRateLimitBackend(os.getenv('RATE_LIMIT_PATH', 'rate_limits.sqlite3'))
+    elif backend_name == 'redis':
+        backend = RedisRateLimitBackend(os.getenv('RATE_LIMIT_URL', 'redis://localhost:6379/0'))
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{backend_name}'")
+    return RateLimiter(
+        backend,
+        user_per_minute=float(os.getenv('RATE_LIMIT_USER_PER_MINUTE', 20)),
+        user_burst=float(os.getenv('RATE_LIMIT_USER_BURST', 5)),
+        anon_per_minute=float(os.getenv('RATE_LIMIT_ANON_PER_MINUTE', 6)),
+        anon_burst=float(os.getenv('RATE_LIMIT_ANON_BURST', 3))
+    )
@@ -0,0 +1,242 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_message(message):
+    """Lowercase a message and drop punctuation and extra whitespace, keeping '+' and '#' for C++/C#"""
+    return ' '.join(re.sub(r'[^\w+#]+', ' ', message.lower()).split())
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """LRU cache in a SQLite file, shared by every worker process on the host"""
+
+    def __init__(self, path='response_cache.sqlite3', max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_last_used ON response_cache (last_used)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM response_cache WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+            # Keep only the most recently used entries
+            conn.execute("""
+                DELETE FROM response_cache WHERE key IN (
+                    SELECT key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM response_cache")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class RedisCacheBackend:
+    """Cache in Redis for deployments spread over several hosts.
+
+    Expiry uses Redis TTLs; size-bounded LRU eviction comes from the server's
+    ``maxmemory`` with ``maxmemory-policy allkeys-lru``.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='iot-assistant:response:'):
+        if redis is None:
+            raise RuntimeError("The redis package is required for the redis response cache backend")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*'))
+
+
+class ResponseCache:
+    """Cache of complete answers keyed on the normalized message, model and question type.
+
+    With a similarity index, an exact-key miss falls back to the closest
+    previously answered question of the same model and question type. The
+    index lives in this process, while the answers it points to stay in the
+    (possibly shared) backend.
+    """
+
+    def __init__(self, backend, ttl=86400, index=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.index = index
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, message, model, question_type):
+        raw = '\x1f'.join([model, question_type, normalize_message(message)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, message, model, question_type):
+        similar = False
+        try:
+            value = self.backend.get(self.make_key(message, model, question_type))
+            if value is None and self.index is not None:
+                match = self.index.lookup(message, scope=(model, question_type))
+                if match is not None:
+                    value = self.backend.get(match[0])
+                    similar = value is not None
+        except Exception as e:
+            logger.error(f"Error reading response cache: {str(e)}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                if similar:
+                    self.similar_hits += 1
+        return value
+
+    def set(self, message, model, question_type, response):
+        key = self.make_key(message, model, question_type)
+        try:
+            self.backend.set(key, response, self.ttl)
+            if self.index is not None:
+                self.index.add(message, key, scope=(model, question_type))
+        except Exception as e:
+            logger.error(f"Error writing response cache: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            hits, similar_hits, misses = self.hits, self.similar_hits, self.misses
+        total = hits + misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': hits,
+            'similar_hits': similar_hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0
+        }
+
+
+def create_response_cache():
+    """Build the response cache configured by the RESPONSE_CACHE_* environment variables, or None"""
+    backend_name = os.getenv('RESPONSE_CACHE_BACKEND', 'memory').lower()
+    size = int(os.getenv('RESPONSE_CACHE_SIZE', 1000))
+    ttl = int(os.getenv('RESPONSE_CACHE_TTL', 86400))
+
+    if backend_name in ('', 'none', 'off'):
+        return None
+    if backend_name == 'memory':
+        backend = MemoryCacheBackend(max_entries=size)
+    elif backend_name == 'sqlite':
+        backend = SQLiteCacheBackend(os.getenv('RESPONSE_CACHE_PATH', 'response_cache.sqlite3'), max_entries=size)
+    elif backend_name == 'redis':
+        backend = RedisCacheBackend(os.getenv('RESPONSE_CACHE_URL', 'redis://localhost:6379/0'))
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND '{backend_name}'")
+    # Imported here so that modules only using the cache backends do not load numpy
+    from similarity_index import create_similarity_index
+    return ResponseCache(backend, ttl=ttl, index=create_similarity_index())
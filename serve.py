@@ -0,0 +1,56 @@
+"""Production entry point: the app on a cooperative gevent or eventlet server.
+
+    pip install -r requirements.txt
+    SOCKETIO_ASYNC_MODE=gevent PORT=5000 python serve.py
+
+Every connection is a greenlet instead of a thread, so thousands of idle
+websockets cost little memory, and the standard library is monkey-patched
+so upstream requests, PyMySQL queries, locks and sleeps yield to other
+greenlets while they wait. SOCKETIO_ASYNC_MODE=threading runs the
+thread-per-connection Werkzeug server instead, for comparison.
+"""
+import os
+
+ASYNC_MODE = os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent')
+
+# Patch before anything else imports socket, ssl or threading, or those modules keep blocking the whole process
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+if ASYNC_MODE in ('gevent', 'eventlet'):
+    # LLM workers and upstream connections are greenlets and sockets, many more of them can wait at once
+    os.environ.setdefault('LLM_MAX_WORKERS', '64')
+    os.environ.setdefault('UPSTREAM_POOL_SIZE', '64')
+
+import sys  # noqa: E402
+import signal  # noqa: E402
+import logging  # noqa: E402
+
+from app import app, socketio  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    # Exit normally on SIGTERM so queued chat messages are flushed by atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if ASYNC_MODE in ('gevent', 'eventlet') and app.config['SQLALCHEMY_DATABASE_URI'].startswith('mysql://'):
+        logger.warning("mysqlclient blocks the event loop during queries, use a mysql+pymysql:// DATABASE_URL")
+    port = int(os.getenv('PORT', 5000))
+    logger.info(f"Serving on port {port} with async mode {socketio.async_mode}")
+    socketio.run(
+        app,
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=port,
+        debug=False,
+        log_output=os.getenv('ACCESS_LOG', 'false').lower() == 'true',
+        allow_unsafe_werkzeug=ASYNC_MODE == 'threading'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class SidebarCache:
+    """Bounded in-memory cache of each user's chat sidebar.
+
+    An entry is the list built by ``loader(user_id)`` (the dicts returned by
+    ``get_conversation_history``), newest chat first. Once loaded it is kept
+    current by ``record_message`` instead of being rebuilt, so page reloads
+    are served without a query. Writes made by other processes are picked up
+    when the entry expires after ``ttl`` seconds. At most ``max_users`` users
+    are kept, least recently used first out. A loader returns None when it
+    could not read the sidebar; that is shown as empty but not cached, so the
+    next request tries again.
+    """
+
+    def __init__(self, loader, max_users=1000, ttl=300):
+        self.loader = loader
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return a copy of the user's sidebar, loading it on a miss"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] + self.ttl >= time.time():
+                self._users.move_to_end(user_id)
+                return [dict(chat) for chat in entry[1]]
+        chats = self.loader(user_id)
+        if chats is None:
+            return []
+        with self._lock:
+            self._users[user_id] = (time.time(), [dict(chat) for chat in chats])
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return chats
+
+    def record_message(self, user_id, chat_id, chat_created_at, user_message, bot_response):
+        """Apply a newly saved message to the cached sidebar, if the user has one"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return
+            chats = entry[1]
+            for chat in chats:
+                if chat['id'] == chat_id:
+                    chat['user_message'] = user_message
+                    chat['bot_response'] = bot_response
+                    chat['message_count'] += 1
+                    return
+            # First message of a chat; chat ids grow with creation time like the sidebar order
+            position = next((i for i, chat in enumerate(chats) if chat['id'] < chat_id), len(chats))
+            chats.insert(position, {
+                'id': chat_id,
+                'user_message': user_message,
+                'bot_response': bot_response,
+                'timestamp': chat_created_at.strftime('%Y-%m-%d %H:%M'),
+                'message_count': 1
+            })
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
@@ -0,0 +1,192 @@
+import os
+import re
+import zlib
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Words that carry no meaning for matching rephrased questions
+STOPWORDS = frozenset("""
+a about an and any are as at be been can could do does for from get give
+had has have help how i if in into is it its me my need of on or our please
+should so some tell that the their them then there these this those to up
+us using use via want was we what when where which who why will with would
+you your
+""".split())
+
+# Generic words around a part or board name that people add or leave out: "a DHT22" and "a DHT22 sensor" ask the same
+FILLER_WORDS = frozenset("""
+sensor module board device chip component best way just
+""".split())
+
+# Board and module names without digits; like part numbers and pin numbers, these must match exactly
+HARDWARE_NAMES = frozenset("""
+uno nano mega micro mini pico zero leonardo due mkr feather wemos nodemcu teensy stm32 attiny atmega
+esp esp32 esp8266 raspberry pi arduino jetson beaglebone
+""".split())
+
+# Mersenne prime 2**31 - 1, small enough that a * hash + b never overflows uint64
+_PRIME = (1 << 31) - 1
+
+
+def question_tokens(message):
+    """Reduce a question to its set of content words, with a crude plural strip and without generic filler"""
+    tokens = set()
+    for word in re.findall(r'[a-z0-9+#]+', message.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        if word in FILLER_WORDS:
+            continue
+        tokens.add(word)
+    return tokens
+
+
+def identifier_tokens(tokens):
+    """The tokens naming specific hardware or values: anything with a digit, and known board names"""
+    return frozenset(token for token in tokens if token in HARDWARE_NAMES or any(c.isdigit() for c in token))
+
+
+class SimilarityIndex:
+    """MinHash/LSH index of answered questions for finding near-duplicates.
+
+    Each question becomes a MinHash signature over its content words; the
+    signature is split into bands and every band is hashed into a bucket, so a
+    lookup only compares against questions sharing at least one bucket.
+    Signatures live in a preallocated array of ``max_entries`` rows that is
+    reused oldest-first, which keeps memory bounded. Questions are scoped, so
+    a lookup never returns an entry stored under another scope. Buckets
+    holding more than ``max_bucket`` questions only come from very common
+    words and are skipped while any other band finds candidates. A match also
+    needs exactly the same identifier tokens (part, pin and version numbers,
+    board names): "DS18B20 on ESP32" and "DS18B20 on ESP8266" are close in
+    words but need different answers.
+    """
+
+    def __init__(self, threshold=0.85, max_entries=10000, num_perm=64, bands=16, max_bucket=500, seed=1):
+        if np is None:
+            raise RuntimeError("numpy is required for the similarity index")
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_bucket = max_bucket
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+        self._signatures = np.zeros((max_entries, num_perm), dtype=np.uint32)
+        self._slots = [None] * max_entries
+        self._slot_by_key = {}
+        self._buckets = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def signature(self, tokens):
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) & _PRIME for token in tokens),
+                             dtype=np.uint64, count=len(tokens))
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, scope, signature):
+        return [(scope, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def add(self, message, key, scope=None):
+        """Index a question whose answer is stored under key"""
+        tokens = question_tokens(message)
+        if not tokens:
+            return
+        signature = self.signature(tokens)
+        band_keys = self._band_keys(scope, signature)
+        identifiers = identifier_tokens(tokens)
+
+        with self._lock:
+            if key in self._slot_by_key:
+                return
+            slot = self._next
+            self._next = (self._next + 1) % self.max_entries
+            self._evict(slot)
+
+            self._signatures[slot] = signature
+            self._slots[slot] = (key, band_keys, identifiers)
+            self._slot_by_key[key] = slot
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, set()).add(slot)
+
+    def _evict(self, slot):
+        old = self._slots[slot]
+        if old is None:
+            return
+        old_key, band_keys, _ = old
+        del self._slot_by_key[old_key]
+        for band_key in band_keys:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del self._buckets[band_key]
+        self._slots[slot] = None
+
+    def lookup(self, message, scope=None):
+        """Return (key, similarity) of the closest indexed question above the threshold, or None"""
+        tokens = question_tokens(message)
+        if not tokens:
+            return None
+        signature = self.signature(tokens)
+        band_keys = self._band_keys(scope, signature)
+        identifiers = identifier_tokens(tokens)
+
+        with self._lock:
+            candidates = set()
+            crowded = []
+            for band_key in band_keys:
+                bucket = self._buckets.get(band_key)
+                if not bucket:
+                    continue
+                if len(bucket) > self.max_bucket:
+                    crowded.append(bucket)
+                else:
+                    candidates.update(bucket)
+            if not candidates:
+                for bucket in crowded:
+                    candidates.update(bucket)
+            # Questions about other hardware or values are never near-duplicates, however many words they share
+            candidates = [slot for slot in candidates if self._slots[slot][2] == identifiers]
+            if not candidates:
+                return None
+            slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            # Fraction of equal MinHash values estimates the Jaccard similarity
+            similarities = (self._signatures[slots] == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                return None
+            return self._slots[slots[best]][0], float(similarities[best])
+
+    def __len__(self):
+        return len(self._slot_by_key)
+
+
+def create_similarity_index():
+    """Build the index configured by the SIMILARITY_* environment variables, or None if disabled"""
+    if os.getenv('SIMILARITY_CACHE', 'false').lower() != 'true':
+        return None
+    if np is None:
+        logger.warning("numpy is not installed, near-duplicate cache lookups are disabled")
+        return None
+    return SimilarityIndex(
+        threshold=float(os.getenv('SIMILARITY_THRESHOLD', 0.85)),
+        max_entries=int(os.getenv('SIMILARITY_INDEX_SIZE', 10000)),
+        num_perm=int(os.getenv('SIMILARITY_NUM_PERM', 64)),
+        bands=int(os.getenv('SIMILARITY_BANDS', 16))
+    )
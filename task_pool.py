@@ -0,0 +1,279 @@
+import time
+import threading
+import logging
+from collections import deque, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the pool's queue is already full.
+
+    ``retry_after`` is the pool's estimate, in seconds, of when it can take the job.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    """A unit of work queued on a WorkerPool"""
+
+    def __init__(self, fn, args, kwargs, key=None, weight=1):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.weight = weight
+        self.started = False
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            logger.error(f"Error running background job: {str(e)}")
+        finally:
+            self.done.set()
+
+
+class FairQueue:
+    """Job queue that takes turns between keys, weighted round-robin.
+
+    Jobs wait in one queue per key (a user or a session), and the keys with
+    waiting jobs take turns: each may start up to its job's ``weight`` jobs
+    before the next key's turn. A key with many queued jobs cannot hold back
+    one with a single job, and a key of weight 3 gets three times the share
+    of one with weight 1. A key that runs out of jobs rejoins at the back.
+    Not thread-safe on its own, WorkerPool holds its lock around every call.
+    """
+
+    def __init__(self):
+        self._queues = OrderedDict()
+        self._credit = {}
+        self._length = 0
+
+    def append(self, job):
+        queue = self._queues.get(job.key)
+        if queue is None:
+            queue = self._queues[job.key] = deque()
+            self._credit[job.key] = job.weight
+        queue.append(job)
+        self._length += 1
+
+    def popleft(self):
+        if not self._queues:
+            raise IndexError("pop from an empty FairQueue")
+        key, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        self._length -= 1
+        self._credit[key] -= 1
+        if not queue:
+            del self._queues[key]
+            del self._credit[key]
+        elif self._credit[key] <= 0:
+            # Turn over, the key goes to the back of the round with fresh credit
+            self._credit[key] = queue[0].weight
+            self._queues.move_to_end(key)
+        return job
+
+    def remove(self, job):
+        queue = self._queues.get(job.key)
+        if queue is None:
+            raise ValueError("job is not queued")
+        queue.remove(job)
+        self._length -= 1
+        if not queue:
+            del self._queues[job.key]
+            del self._credit[job.key]
+
+    def count(self, key):
+        """Jobs queued for one key"""
+        queue = self._queues.get(key)
+        return len(queue) if queue is not None else 0
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        """Queued jobs in the order they will start, if nothing else is queued meanwhile"""
+        queues = OrderedDict((key, deque(queue)) for key, queue in self._queues.items())
+        credit = dict(self._credit)
+        while queues:
+            key, queue = next(iter(queues.items()))
+            yield queue.popleft()
+            credit[key] -= 1
+            if not queue:
+                del queues[key]
+            elif credit[key] <= 0:
+                credit[key] = queue[0].weight
+                queues.move_to_end(key)
+
+
+class WorkerPool:
+    """Run blocking jobs on a fixed number of workers behind a bounded queue.
+
+    At most ``max_workers`` jobs run at once and at most ``queue_depth`` more
+    wait for a free worker; submitting beyond that raises QueueFull so the
+    caller can answer straight away instead of piling up blocked handlers.
+    Workers are started lazily through ``spawn``, which defaults to a daemon
+    thread and can be ``socketio.start_background_task`` so the pool follows
+    the server's async mode.
+
+    With ``fair=True`` queued jobs are started by weighted round-robin over
+    their keys (see FairQueue) instead of first come, first served, and
+    ``max_queued_per_key`` caps how many jobs a single key may have waiting.
+
+    The pool keeps a moving average of how long jobs run, to estimate how
+    long a queued job will wait. With ``max_wait`` set, a job that would wait
+    longer than that is refused like one over the queue depth, so under a
+    spike some callers are told to come back instead of everyone waiting.
+    """
+
+    def __init__(self, max_workers=8, queue_depth=32, spawn=None, fair=False, max_queued_per_key=None,
+                 max_wait=None, default_service_time=5.0):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self.queue_depth = max(queue_depth, 0)
+        self._spawn = spawn or self._spawn_thread
+        self.max_queued_per_key = max_queued_per_key if fair else None
+        self._queue = FairQueue() if fair else deque()
+        self.max_wait = max_wait
+        self.default_service_time = default_service_time
+        self._service_time = None
+        self._cond = threading.Condition()
+        self._workers = 0
+        self._idle = 0
+        self._active = 0
+        self._shutdown = False
+
+    @staticmethod
+    def _spawn_thread(target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return its Job, or raise QueueFull"""
+        return self.submit_for(None, 1, fn, *args, **kwargs)
+
+    def submit_for(self, key, weight, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) on behalf of key, scheduled with weight in a fair pool"""
+        job = Job(fn, args, kwargs, key, weight)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit to a pool that has been shut down")
+            if self._active + len(self._queue) >= self.max_workers + self.queue_depth:
+                raise QueueFull(f"{len(self._queue)} jobs already queued", self._wait_for(len(self._queue) + 1))
+            if self.max_queued_per_key is not None and self._queue.count(key) >= self.max_queued_per_key:
+                raise QueueFull(f"{self.max_queued_per_key} jobs already queued for {key}",
+                                self._wait_for(len(self._queue) + 1))
+            if self.max_wait is not None and self._service_time is not None:
+                wait = self._wait_for(len(self._queue) + 1)
+                if wait > self.max_wait:
+                    raise QueueFull(f"Estimated wait of {wait:.1f}s is over {self.max_wait}s", wait)
+            self._queue.append(job)
+            # Start another worker only when the idle ones cannot take every queued job
+            start_worker = len(self._queue) > self._idle and self._workers < self.max_workers
+            if start_worker:
+                self._workers += 1
+            self._cond.notify()
+        if start_worker:
+            self._spawn(self._worker)
+        return job
+
+    def cancel(self, job):
+        """Remove a job that has not started yet; returns True if it was removed"""
+        with self._cond:
+            if job.started or job.cancelled:
+                return False
+            try:
+                self._queue.remove(job)
+            except ValueError:
+                return False
+            job.cancelled = True
+        job.done.set()
+        return True
+
+    def _wait_for(self, position):
+        # Jobs ahead start as workers free up, max_workers at a time
+        if self._active + position <= self.max_workers:
+            return 0.0
+        service_time = self._service_time if self._service_time is not None else self.default_service_time
+        return service_time * position / self.max_workers
+
+    def estimated_wait(self, position):
+        """Seconds until the job at this queue position (1 is next) should start"""
+        with self._cond:
+            return self._wait_for(position)
+
+    def queued_jobs(self):
+        """Jobs waiting for a worker, in the order they will start"""
+        with self._cond:
+            return list(self._queue)
+
+    def waiting_positions(self):
+        """Queue positions (1 is next) of the jobs that have to wait for a busy worker.
+
+        Jobs still in the queue only because an idle worker has not taken them
+        yet are left out, they start without waiting.
+        """
+        with self._cond:
+            return {job: position for position, job in enumerate(self._queue, 1)
+                    if self._active + position > self.max_workers}
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self._active,
+                'queued': len(self._queue),
+                'service_time': self._service_time,
+                'workers': self._workers,
+                'max_workers': self.max_workers,
+                'queue_depth': self.queue_depth
+            }
+
+    def shutdown(self, wait=True, timeout=None):
+        """Stop accepting jobs and let the workers exit once the queue is drained"""
+        with self._cond:
+            self._shutdown = True
+            pending = list(self._queue)
+            self._cond.notify_all()
+        if wait:
+            for job in pending:
+                job.done.wait(timeout)
+
+    def _next_job(self):
+        with self._cond:
+            while not self._queue:
+                if self._shutdown:
+                    self._workers -= 1
+                    return None
+                self._idle += 1
+                self._cond.wait()
+                self._idle -= 1
+            job = self._queue.popleft()
+            job.started = True
+            self._active += 1
+            return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            started = time.monotonic()
+            try:
+                job.run()
+            finally:
+                elapsed = time.monotonic() - started
+                with self._cond:
+                    self._active -= 1
+                    # Moving average of the run time, recent jobs count most
+                    if self._service_time is None:
+                        self._service_time = elapsed
+                    else:
+                        self._service_time += 0.1 * (elapsed - self._service_time)
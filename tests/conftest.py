@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeProvider(ThreadingHTTPServer):
+    """OpenAI-compatible upstream whose behaviour is picked by the requested model.
+
+    ``ok`` streams a short answer; ``stall`` sends the headers and a role-only
+    chunk, then goes quiet for ``stall_seconds``; ``cut`` sends the same and
+    then drops the connection in the middle of a chunk; ``slow`` sends the
+    role-only chunk at once but the answer only after ``stall_seconds``,
+    like a provider slow to produce tokens; ``queued`` waits
+    ``stall_seconds`` before sending even the headers, like a provider that
+    is still queueing or prefilling; ``padded`` streams the answer with
+    whitespace inside it and blank lines after it.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeProviderHandler)
+        self.requests = []
+        self.stall_seconds = 5
+        self.released = threading.Event()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1'
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_event(self, payload):
+        data = f"data: {json.dumps(payload) if isinstance(payload, dict) else payload}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        model = body['model']
+        self.server.requests.append(model)
+        if model == 'queued':
+            self.server.released.wait(self.server.stall_seconds)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.send_event({'choices': [{'delta': {'role': 'assistant'}, 'finish_reason': None}]})
+        if model == 'stall':
+            self.server.released.wait(self.server.stall_seconds)
+            self.close_connection = True
+            return
+        if model == 'slow':
+            self.server.released.wait(self.server.stall_seconds)
+        if model == 'cut':
+            self.wfile.write(b"40\r\ndata: {\"choi")
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        words = ('Use', ' an', ' ESP32', ' sensor.')
+        if model == 'padded':
+            words = ('Use', ' an\n\n', ' ', ' ESP32', ' sensor.\n\n', ' ')
+        for word in words:
+            self.send_event({'choices': [{'delta': {'content': word}, 'finish_reason': None}]})
+            time.sleep(0.01)
+        self.send_event({'choices': [{'delta': {}, 'finish_reason': 'stop'}]})
+        self.send_event('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+@pytest.fixture
+def provider():
+    server = FakeProvider()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.released.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_chatbot(provider, monkeypatch):
+    """IoTChatbot against the fake provider, routing every question to the given models in order"""
+    def make(*models, read_timeout=0.5, hedge=False, hedge_to_fallback=False):
+        monkeypatch.setenv('OPENAI_API_BASE', provider.url)
+        monkeypatch.setenv('NETMIND_API_KEY', 'test')
+        monkeypatch.setenv('MODEL_ROUTING', json.dumps({'tiers': {'default': list(models)}}))
+        monkeypatch.setenv('UPSTREAM_READ_TIMEOUT', str(read_timeout))
+        monkeypatch.setenv('UPSTREAM_MAX_RETRIES', '0')
+        monkeypatch.setenv('RESPONSE_CACHE_BACKEND', 'none')
+        monkeypatch.setenv('HEDGE_REQUESTS', 'true' if hedge else 'false')
+        monkeypatch.setenv('HEDGE_DELAY', '0.1')
+        monkeypatch.setenv('HEDGE_TO_FALLBACK', 'true' if hedge_to_fallback else 'false')
+        from iot_chatbot import IoTChatbot
+        return IoTChatbot()
+    return make
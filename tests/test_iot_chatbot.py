@@ -0,0 +1,66 @@
+import pytest
+
+QUESTION = 'How do I read a DHT22 sensor with an ESP32?'
+
+
+@pytest.mark.parametrize('failing_model', ['stall', 'cut'])
+def test_stream_falls_back_when_the_stream_fails_before_content(make_chatbot, provider, failing_model):
+    chatbot = make_chatbot(failing_model, 'ok')
+
+    answer = ''.join(chatbot.stream_response(QUESTION))
+
+    assert provider.requests == [failing_model, 'ok']
+    assert answer.startswith('Use an ESP32 sensor.')
+
+
+@pytest.mark.parametrize('failing_model', ['stall', 'cut'])
+def test_stream_failure_is_an_upstream_error(make_chatbot, failing_model):
+    from upstream_client import UpstreamError
+
+    chatbot = make_chatbot(failing_model)
+    stream = chatbot.upstream.stream_chat_completion(model=failing_model, messages=[])
+
+    with pytest.raises(UpstreamError):
+        list(stream)
+
+
+@pytest.mark.parametrize('hedge', [False, True])
+@pytest.mark.parametrize('slow_model', ['stall', 'queued'])
+def test_stop_before_the_first_chunk_aborts_the_stream(make_chatbot, provider, slow_model, hedge):
+    import threading
+    import time
+    from hedging import StopEvent
+
+    chatbot = make_chatbot(slow_model, 'ok', read_timeout=5, hedge=hedge)
+    stop_event = StopEvent()
+    threading.Timer(0.3, stop_event.set).start()
+
+    started = time.perf_counter()
+    answer = ''.join(chatbot.stream_response(QUESTION, stop_event=stop_event))
+
+    assert time.perf_counter() - started < 2
+    assert answer == ''
+    assert 'ok' not in provider.requests
+
+
+def test_hedge_races_for_the_first_content_not_the_role_chunk(make_chatbot, provider):
+    import time
+
+    chatbot = make_chatbot('slow', 'ok', read_timeout=10, hedge=True, hedge_to_fallback=True)
+
+    started = time.perf_counter()
+    answer = ''.join(chatbot.stream_response(QUESTION))
+
+    assert time.perf_counter() - started < 2
+    assert answer.startswith('Use an ESP32 sensor.')
+    assert provider.requests == ['slow', 'ok']
+    assert chatbot.stream_hedger.won == 1
+
+
+def test_streamed_answer_ends_without_trailing_whitespace(make_chatbot):
+    chatbot = make_chatbot('padded')
+
+    answer = ''.join(chatbot.stream_response(QUESTION))
+
+    # Whitespace inside the answer is kept, only the end is stripped like get_response does
+    assert answer == 'Use an\n\n  ESP32 sensor.'
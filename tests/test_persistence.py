@@ -0,0 +1,102 @@
+import atexit
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from database import db, ChatHistory, ChatMessage, User
+from persistence import WriteBehindQueue
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'chat.db'}"
+    db.init_app(app)
+    with app.app_context():
+        # Enforce foreign keys, as MySQL does, so a message for a deleted chat fails
+        event.listen(db.engine, 'connect', lambda conn, record: conn.execute('PRAGMA foreign_keys=ON'))
+        db.create_all()
+        user = User(username='writer', email='writer@example.com', password='password')
+        db.session.add(user)
+        db.session.commit()
+        chat = ChatHistory(user_id=user.id)
+        db.session.add(chat)
+        db.session.commit()
+        app.config['CHAT_ID'] = chat.id
+    return app
+
+
+def saved_messages(app):
+    with app.app_context():
+        return [message.user_message for message in ChatMessage.query.order_by(ChatMessage.id)]
+
+
+@pytest.fixture
+def stalled_writer(app):
+    """Make started queues whose flusher never runs, so rows stay queued until flushed by hand"""
+    writers = []
+
+    def make(**kwargs):
+        writer = WriteBehindQueue(app, spawn=lambda target: None, **kwargs)
+        writer.start()
+        writers.append(writer)
+        return writer
+
+    yield make
+    # Nothing to flush at exit, the database is gone by then
+    for writer in writers:
+        atexit.unregister(writer.close)
+
+
+def test_a_failing_row_does_not_hold_up_the_others(app, stalled_writer):
+    writer = stalled_writer(max_attempts=3)
+    chat_id = app.config['CHAT_ID']
+    writer.enqueue(chat_id, 'first', 'answer')
+    writer.enqueue(chat_id + 100, 'for a deleted chat', 'answer')
+    writer.enqueue(chat_id, 'second', 'answer')
+
+    writer.flush(force=True)
+
+    assert saved_messages(app) == ['first', 'second']
+    assert writer.has_pending(chat_id=chat_id + 100)
+
+
+def test_a_row_that_keeps_failing_is_dropped(app, stalled_writer):
+    writer = stalled_writer(max_attempts=3)
+    chat_id = app.config['CHAT_ID']
+    writer.enqueue(chat_id + 100, 'for a deleted chat', 'answer')
+
+    for _ in range(3):
+        writer.flush(force=True)
+    writer.enqueue(chat_id, 'later', 'answer')
+    writer.flush(force=True)
+
+    assert not writer.has_pending()
+    assert saved_messages(app) == ['later']
+
+
+def test_failures_back_off_before_retrying(app, stalled_writer):
+    writer = stalled_writer(max_attempts=3, flush_interval=60)
+    writer.enqueue(app.config['CHAT_ID'] + 100, 'for a deleted chat', 'answer')
+    writer.flush(force=True)
+
+    writer.flush()
+    writer.flush()
+
+    # Only the forced flush counted, the row has attempts left
+    assert writer.has_pending()
+    writer.flush(force=True)
+    writer.flush(force=True)
+    assert not writer.has_pending()
+
+
+def test_a_full_queue_writes_synchronously(app, stalled_writer):
+    writer = stalled_writer(max_pending=2)
+    chat_id = app.config['CHAT_ID']
+    for text in ('one', 'two', 'three'):
+        writer.enqueue(chat_id, text, 'answer')
+
+    assert saved_messages(app) == ['three']
+    writer.flush(force=True)
+    assert sorted(saved_messages(app)) == ['one', 'three', 'two']
@@ -0,0 +1,29 @@
+import time
+
+from rate_limit import RateLimiter, SQLiteRateLimitBackend
+
+
+def test_limiters_on_one_sqlite_file_share_a_bucket(tmp_path):
+    path = str(tmp_path / 'rate_limits.sqlite3')
+    # Two worker processes of one host, each with its own limiter
+    first = RateLimiter(SQLiteRateLimitBackend(path), user_per_minute=6, user_burst=2)
+    second = RateLimiter(SQLiteRateLimitBackend(path), user_per_minute=6, user_burst=2)
+
+    assert first.check('user:1', True) == 0
+    assert second.check('user:1', True) == 0
+    assert second.check('user:1', True) > 0
+    assert first.check('user:1', True) > 0
+    # Another user has a bucket of their own
+    assert first.check('user:2', True) == 0
+
+
+def test_sqlite_bucket_refills_over_time(tmp_path):
+    path = str(tmp_path / 'rate_limits.sqlite3')
+    limiter = RateLimiter(SQLiteRateLimitBackend(path), user_per_minute=600, user_burst=1)
+
+    assert limiter.check('user:1', True) == 0
+    retry_after = limiter.check('user:1', True)
+    assert 0 < retry_after <= 0.1
+
+    time.sleep(retry_after + 0.05)
+    assert RateLimiter(SQLiteRateLimitBackend(path), user_per_minute=600, user_burst=1).check('user:1', True) == 0
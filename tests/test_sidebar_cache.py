@@ -0,0 +1,27 @@
+from sidebar_cache import SidebarCache
+
+CHAT = {'id': 1, 'user_message': 'hi', 'bot_response': 'hello', 'timestamp': '2024-01-01 10:00',
+        'message_count': 1}
+
+
+def test_a_failed_load_is_not_cached():
+    results = [None, [CHAT]]
+    cache = SidebarCache(lambda user_id: results.pop(0))
+
+    assert cache.get(7) == []
+    assert cache.get(7) == [CHAT]
+    assert not results
+
+
+def test_a_loaded_sidebar_is_served_from_the_cache():
+    loads = []
+
+    def loader(user_id):
+        loads.append(user_id)
+        return [dict(CHAT)]
+
+    cache = SidebarCache(loader)
+    cache.get(7)
+
+    assert cache.get(7) == [CHAT]
+    assert loads == [7]
@@ -0,0 +1,56 @@
+import pytest
+
+from response_cache import ResponseCache, MemoryCacheBackend
+from similarity_index import SimilarityIndex, create_similarity_index
+
+# Close in wording, but the answer to one is wrong for the other
+DIFFERENT_HARDWARE = [
+    ('How do I read a DS18B20 temperature sensor on ESP32?',
+     'How do I read a DS18B20 temperature sensor on ESP8266?'),
+    ('How do I blink an LED on pin 13 of my Arduino?',
+     'How do I blink an LED on pin 12 of my Arduino?'),
+    ('How do I power an Arduino Uno from a 9V battery?',
+     'How do I power an Arduino Mega from a 9V battery?'),
+    ('Which resistor for a 3.3V LED on a Raspberry Pi GPIO?',
+     'Which resistor for a 5V LED on a Raspberry Pi GPIO?'),
+]
+
+
+@pytest.mark.parametrize('stored, asked', DIFFERENT_HARDWARE)
+def test_questions_about_other_hardware_or_values_do_not_match(stored, asked):
+    index = SimilarityIndex(threshold=0.5)
+    index.add(stored, 'stored')
+
+    assert index.lookup(asked) is None
+
+
+@pytest.mark.parametrize('stored, asked', DIFFERENT_HARDWARE)
+def test_cache_does_not_serve_the_answer_for_other_hardware(stored, asked):
+    cache = ResponseCache(MemoryCacheBackend(), index=SimilarityIndex())
+    cache.set(stored, 'model', 'code', 'the answer for the first question')
+
+    assert cache.get(asked, 'model', 'code') is None
+
+
+def test_rephrasing_with_filler_words_matches_at_the_default_threshold():
+    index = SimilarityIndex()
+    index.add('How do I connect a DHT22 to ESP32?', 'stored')
+
+    match = index.lookup('connect dht22 sensor to an esp32')
+
+    assert match is not None and match[0] == 'stored'
+
+
+def test_reworded_question_with_the_same_hardware_matches():
+    index = SimilarityIndex()
+    index.add('How do I read a DS18B20 temperature sensor on ESP32 over MQTT?', 'stored')
+
+    match = index.lookup('read DS18B20 temperature sensors on an ESP32 over MQTT')
+
+    assert match is not None and match[0] == 'stored'
+
+
+def test_near_duplicate_lookups_are_off_by_default(monkeypatch):
+    monkeypatch.delenv('SIMILARITY_CACHE', raising=False)
+
+    assert create_similarity_index() is None
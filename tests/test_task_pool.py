@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from task_pool import FairQueue, Job, QueueFull, WorkerPool
+
+
+def test_job_handed_to_an_idle_worker_has_no_waiting_position():
+    # The worker is never spawned, as if it had not picked the job up yet
+    pool = WorkerPool(max_workers=2, spawn=lambda target: None)
+
+    pool.submit(lambda: None)
+
+    assert pool.waiting_positions() == {}
+
+
+def test_jobs_behind_busy_workers_have_waiting_positions():
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+
+    pool = WorkerPool(max_workers=1, fair=True)
+    try:
+        pool.submit_for('a', 1, blocking)
+        assert started.wait(5)
+        second = pool.submit_for('b', 1, lambda: None)
+        third = pool.submit_for('c', 1, lambda: None)
+
+        assert pool.waiting_positions() == {second: 1, third: 2}
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def queue_of(*keys_and_weights, jobs_per_key=4):
+    queue = FairQueue()
+    for key, weight in keys_and_weights:
+        for _ in range(jobs_per_key):
+            queue.append(Job(lambda: None, (), {}, key, weight))
+    return queue
+
+
+def drain(queue):
+    order = []
+    while queue:
+        order.append(queue.popleft().key)
+    return order
+
+
+def test_fair_queue_gives_each_key_its_weight_in_turns():
+    queue = queue_of(('a', 3), ('b', 1))
+
+    assert drain(queue) == ['a', 'a', 'a', 'b', 'a', 'b', 'b', 'b']
+
+
+def test_fair_queue_order_matches_iteration():
+    queue = queue_of(('a', 3), ('b', 1), ('c', 2))
+
+    assert [job.key for job in queue] == drain(queue)
+
+
+def test_a_key_with_many_jobs_does_not_starve_one_with_a_single_job():
+    queue = FairQueue()
+    for _ in range(50):
+        queue.append(Job(lambda: None, (), {}, 'busy', 1))
+    queue.append(Job(lambda: None, (), {}, 'single', 1))
+
+    assert drain(queue)[:2] == ['busy', 'single']
+
+
+def test_max_queued_per_key_refuses_more_jobs_for_that_key():
+    release = threading.Event()
+    pool = WorkerPool(max_workers=1, queue_depth=10, fair=True, max_queued_per_key=2)
+    try:
+        pool.submit_for('a', 1, release.wait, 5)
+        pool.submit_for('a', 1, lambda: None)
+        pool.submit_for('a', 1, lambda: None)
+
+        with pytest.raises(QueueFull):
+            pool.submit_for('a', 1, lambda: None)
+        # Other keys still get in
+        pool.submit_for('b', 1, lambda: None)
+    finally:
+        release.set()
+        pool.shutdown()
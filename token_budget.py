@@ -0,0 +1,103 @@
+import os
+import json
+import threading
+from collections import deque
+
+# Rough token accounting for prompt budgets. Llama-style tokenizers average
+# about four characters of English per token, which is close enough for
+# trimming context and comparing prompt sizes without loading a tokenizer.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a piece of text"""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to roughly max_tokens, marking the cut"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(max_chars - 1, 0)].rstrip() + '…'
+
+
+# Per-type (floor, ceiling) overrides of the output budget; code answers need room for whole listings
+DEFAULT_OUTPUT_LIMITS = {'code': (1024, 4096)}
+
+
+class OutputBudget:
+    """Per-question-type ``max_tokens`` derived from the lengths of recent answers.
+
+    The budget of a type is the ``percentile`` of its last ``window`` answer
+    lengths times ``headroom``, kept between its floor and ceiling; until
+    ``min_samples`` answers of the type have been seen it is the ceiling.
+    Answers cut off by the budget only say that the real answer was longer, so
+    they are recorded at twice their length and a type that keeps running into
+    its budget grows it again. ``limits`` maps question types to their own
+    (floor, ceiling).
+    """
+
+    def __init__(self, floor=256, ceiling=4096, percentile=0.95, headroom=1.25, window=500, min_samples=20,
+                 limits=None):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.percentile = percentile
+        self.headroom = headroom
+        self.window = window
+        self.min_samples = min_samples
+        self.limits = dict(limits or {})
+        self._lengths = {}
+        self._lock = threading.Lock()
+
+    def limits_for(self, question_type):
+        floor, ceiling = self.limits.get(question_type, (self.floor, self.ceiling))
+        return floor, max(floor, ceiling)
+
+    def max_tokens(self, question_type):
+        """The max_tokens to request for an answer of this type"""
+        floor, ceiling = self.limits_for(question_type)
+        with self._lock:
+            lengths = self._lengths.get(question_type)
+            if lengths is None or len(lengths) < self.min_samples:
+                return ceiling
+            ordered = sorted(lengths)
+        observed = ordered[min(int(self.percentile * len(ordered)), len(ordered) - 1)]
+        return max(floor, min(int(observed * self.headroom), ceiling))
+
+    def record(self, question_type, tokens, truncated=False):
+        """Record the length in tokens of an answer, and whether max_tokens cut it off"""
+        if truncated:
+            tokens = min(tokens * 2, self.limits_for(question_type)[1])
+        with self._lock:
+            lengths = self._lengths.get(question_type)
+            if lengths is None:
+                lengths = self._lengths[question_type] = deque(maxlen=self.window)
+            lengths.append(tokens)
+
+    def stats(self):
+        with self._lock:
+            types = {question_type: len(lengths) for question_type, lengths in self._lengths.items()}
+        return {question_type: {'samples': samples, 'max_tokens': self.max_tokens(question_type)}
+                for question_type, samples in types.items()}
+
+
+def create_output_budget():
+    """Build the output budget configured by the OUTPUT_BUDGET_* environment variables, or None if it is off"""
+    if os.getenv('OUTPUT_BUDGET', 'true').lower() != 'true':
+        return None
+    limits = dict(DEFAULT_OUTPUT_LIMITS)
+    if os.getenv('OUTPUT_BUDGET_LIMITS'):
+        limits.update({question_type: tuple(bounds)
+                       for question_type, bounds in json.loads(os.getenv('OUTPUT_BUDGET_LIMITS')).items()})
+    return OutputBudget(
+        floor=int(os.getenv('OUTPUT_BUDGET_FLOOR', 256)),
+        ceiling=int(os.getenv('OUTPUT_BUDGET_CEILING', 4096)),
+        percentile=float(os.getenv('OUTPUT_BUDGET_PERCENTILE', 0.95)),
+        headroom=float(os.getenv('OUTPUT_BUDGET_HEADROOM', 1.25)),
+        window=int(os.getenv('OUTPUT_BUDGET_WINDOW', 500)),
+        min_samples=int(os.getenv('OUTPUT_BUDGET_MIN_SAMPLES', 20)),
+        limits=limits
+    )
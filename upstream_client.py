@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import random
+import socket
+import logging
+import threading
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from metrics import UPSTREAM_RETRIES, UPSTREAM_FAST_FAILS
+
+logger = logging.getLogger(__name__)
+
+# Statuses that mean the request was not processed and may be sent again
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class UpstreamError(Exception):
+    """Raised when the upstream chat completion API cannot give an answer"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    every call is refused for ``reset_timeout`` seconds. Then a single trial
+    call is let through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release(self):
+        """End a trial call without a verdict, e.g. when the caller cancelled it"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Upstream circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+
+def _shutdown(sock):
+    # Closing alone does not wake a read blocked in another thread, shutting the socket down does
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _AwaitingHeaders:
+    """The socket a request waits on for its response headers, so a cancel from another thread can cut it"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def attach(self, sock):
+        with self._lock:
+            self._sock = sock
+            if not self.cancelled:
+                return
+        _shutdown(sock)
+
+    def detach(self):
+        with self._lock:
+            self._sock = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            sock = self._sock
+        if sock is not None:
+            _shutdown(sock)
+
+
+# The _AwaitingHeaders of the request this thread is sending, read by the connection it goes out on
+_sending = threading.local()
+
+
+class _CancellableConnection:
+    def getresponse(self):
+        awaiting = getattr(_sending, 'awaiting', None)
+        if awaiting is None or self.sock is None:
+            return super().getresponse()
+        # Detached as soon as the headers are in, the pooled connection may serve another request next
+        awaiting.attach(self.sock)
+        try:
+            return super().getresponse()
+        finally:
+            awaiting.detach()
+
+
+class _HTTPConnection(_CancellableConnection, urllib3.connection.HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_CancellableConnection, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class _HTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class CancellableAdapter(HTTPAdapter):
+    """HTTPAdapter whose requests can be cut off while they wait for the response headers.
+
+    A provider that is queueing or prefilling sends no headers, so
+    ``session.post()`` blocks until it does; cancelling the _AwaitingHeaders
+    set for the sending thread shuts the connection's socket down instead.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _HTTPConnectionPool, 'https': _HTTPSConnectionPool}
+
+
+class ChatStream:
+    """Iterator over the chunks of a streamed chat completion.
+
+    ``close()`` closes the HTTP response itself, which drops the connection
+    so the provider stops generating. It may be called from another thread,
+    in which case the blocked read ends and iteration stops quietly.
+    """
+
+    def __init__(self, response, on_complete):
+        self.response = response
+        self._on_complete = on_complete
+        self._closed = False
+
+    def __iter__(self):
+        buffer = b''
+        try:
+            while True:
+                # read1 returns as soon as some data has arrived instead of filling a buffer
+                data = self.response.raw.read1(65536, decode_content=True)
+                if not data:
+                    break
+                buffer += data
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    line = line.strip()
+                    if not line.startswith(b'data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == b'[DONE]':
+                        self._finish(True)
+                        return
+                    yield json.loads(payload)
+            self._finish(True)
+        except Exception as e:
+            if self._closed:
+                # A read cut short by close() ends in whatever way the torn down response allows
+                return
+            self._finish(False)
+            # read1 is urllib3's, a stall or reset mid-stream raises its ReadTimeoutError/ProtocolError or an OSError
+            if isinstance(e, (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, OSError)):
+                raise UpstreamError(f"Upstream stream failed: {str(e)}") from e
+            raise
+        finally:
+            self.close()
+
+    def _finish(self, ok):
+        if self._on_complete is not None:
+            on_complete, self._on_complete = self._on_complete, None
+            on_complete(ok)
+
+    def close(self):
+        # Stopping early is not an upstream failure
+        self._finish(True)
+        if not self._closed:
+            self._closed = True
+            sock = getattr(getattr(self.response.raw, 'connection', None), 'sock', None)
+            if sock is not None:
+                _shutdown(sock)
+            self.response.close()
+
+
+class UpstreamClient:
+    """Client for an OpenAI-compatible chat completion API.
+
+    One ``requests.Session`` keeps up to ``pool_size`` keep-alive connections
+    to the provider, so TLS handshakes are not repeated per message. Every
+    request has a connect and a read timeout; the read timeout also bounds the
+    gap between two streamed chunks. Connection failures and 429/502/503/504
+    responses are retried up to ``max_retries`` times with jittered
+    exponential backoff, since the provider has not started on them. Each
+    model has its own CircuitBreaker, which refuses calls while that model
+    keeps failing so callers can fall back to another one straight away.
+    """
+
+    def __init__(self, api_base, api_key, pool_size=20, connect_timeout=3.05, read_timeout=60,
+                 max_retries=2, backoff=0.5, max_backoff=8, breaker_threshold=5, breaker_reset=30):
+        self.api_base = api_base.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = CancellableAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    def breaker(self, model):
+        """The circuit breaker of one model"""
+        with self._breakers_lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def available(self, model):
+        """False while the model's circuit is open, so a caller can skip straight to a fallback"""
+        return self.breaker(model).state != 'open'
+
+    def chat_completion(self, handle=None, **params):
+        """Return the parsed JSON of a non-streamed chat completion.
+
+        A hedging.HedgeHandle, if given, closes the response when cancelled.
+        """
+        breaker = self.breaker(params.get('model'))
+        # The body is read separately so that a cancel can close the response while it arrives
+        response = self._post(dict(params, stream=False), breaker, handle)
+        if handle is not None:
+            handle.on_cancel(response.close)
+        try:
+            body = response.json()
+        except (ValueError, requests.exceptions.RequestException) as e:
+            self._record_failure(breaker, handle)
+            raise UpstreamError(f"Upstream returned an unreadable body: {str(e)}") from e
+        finally:
+            response.close()
+        breaker.record_success()
+        return body
+
+    def stream_chat_completion(self, handle=None, **params):
+        """Return a ChatStream of chunk dicts for a streamed chat completion"""
+        breaker = self.breaker(params.get('model'))
+        response = self._post(dict(params, stream=True), breaker, handle)
+        stream = ChatStream(response, lambda ok: breaker.record_success() if ok else breaker.record_failure())
+        if handle is not None:
+            handle.on_cancel(stream.close)
+        return stream
+
+    @staticmethod
+    def _record_failure(breaker, handle):
+        # A request cancelled by the caller did not fail upstream
+        if handle is not None and handle.cancelled:
+            breaker.release()
+        else:
+            breaker.record_failure()
+
+    def _post(self, payload, breaker, handle=None):
+        if not breaker.allow():
+            UPSTREAM_FAST_FAILS.inc()
+            raise CircuitOpenError(f"Model '{payload.get('model')}' is unavailable, its circuit is open")
+
+        # Registered before sending, a cancel also cuts a request still waiting for the response headers
+        awaiting = _AwaitingHeaders()
+        if handle is not None:
+            handle.on_cancel(awaiting.cancel)
+
+        attempt = 0
+        while True:
+            retry_after = None
+            _sending.awaiting = awaiting
+            try:
+                response = self.session.post(f'{self.api_base}/chat/completions', json=payload,
+                                             timeout=self.timeout, stream=True)
+            except requests.exceptions.ConnectionError as e:
+                # Includes connect timeouts and stale keep-alive connections
+                error = UpstreamError(f"Could not reach upstream: {str(e)}")
+            except requests.exceptions.RequestException as e:
+                # A read timeout is not retried, the provider may still be generating
+                self._record_failure(breaker, handle)
+                raise UpstreamError(f"Upstream request failed: {str(e)}") from e
+            else:
+                if response.status_code < 400:
+                    return response
+                error = UpstreamError(f"Upstream returned HTTP {response.status_code}: {response.text[:200]}",
+                                      status=response.status_code)
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+                if response.status_code not in RETRY_STATUSES:
+                    # A rejected request would fail the same way again; only server errors count against upstream
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    raise error
+            finally:
+                _sending.awaiting = None
+
+            if attempt >= self.max_retries or (handle is not None and handle.cancelled):
+                self._record_failure(breaker, handle)
+                raise error
+            attempt += 1
+            UPSTREAM_RETRIES.inc()
+            time.sleep(self._retry_delay(attempt, retry_after))
+
+    def _retry_delay(self, attempt, retry_after=None):
+        # Full jitter spreads out the retries of many workers failing at once
+        delay = random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+            except ValueError:
+                pass
+        return delay
+
+    def warm_up(self):
+        """Open a pooled connection to the provider ahead of the first message; returns False if it failed.
+
+        Any response, even an error status, leaves the connection and its TLS
+        session in the pool for the next request.
+        """
+        try:
+            response = self.session.get(f'{self.api_base}/models', timeout=self.timeout)
+            response.close()
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Could not warm up the upstream connection: {str(e)}")
+            return False
+
+    def close(self):
+        self.session.close()
+
+
+def create_upstream_client():
+    """Build the upstream client configured by the OPENAI_API_BASE and UPSTREAM_* environment variables"""
+    return UpstreamClient(
+        api_base=os.getenv('OPENAI_API_BASE', 'https://api.netmind.ai/inference-api/openai/v1'),
+        api_key=os.getenv('NETMIND_API_KEY'),
+        pool_size=int(os.getenv('UPSTREAM_POOL_SIZE', 20)),
+        connect_timeout=float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(os.getenv('UPSTREAM_READ_TIMEOUT', 60)),
+        max_retries=int(os.getenv('UPSTREAM_MAX_RETRIES', 2)),
+        breaker_threshold=int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', 5)),
+        breaker_reset=float(os.getenv('UPSTREAM_BREAKER_RESET', 30))
+    )